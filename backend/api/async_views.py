@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .profiling import installed_query_wrappers, query_wrappers
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASGI_THREADS, thread_name_prefix="api-async"
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    """Run a sync view and render its response in a pool thread.
+
+    Every pool thread keeps its own database connection, so stale ones
+    are closed around the call as request_started/finished do in WSGI,
+    and the query wrappers of metrics and profiling are installed on it.
+    """
+    close_old_connections()
+    try:
+        with installed_query_wrappers(query_wrappers.get()):
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, "render", None)):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view, methods=("GET", "HEAD")):
+    """Wrap a sync DRF view into a coroutine served from the pool.
+
+    Under ASGI Django 3.2 runs all sync views of a process in a single
+    thread. Requests with the given methods run concurrently, bounded
+    by ASGI_THREADS and so by the number of database connections. The
+    others, writes among them, stay in that thread as unwrapped views.
+    """
+    serial_view = sync_to_async(view, thread_sensitive=True)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in methods:
+            return await serial_view(request, *args, **kwargs)
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            executor,
+            partial(context.run, run_view, view, request, *args, **kwargs),
+        )
+
+    return wrapper
+
+
+def is_asgi_request(request):
+    """Whether a Django or DRF request came through the ASGI handler."""
+    return "wsgi.input" not in request.META
@@ -1,28 +1,68 @@
 from django.contrib.auth import get_user_model
+from django.db.models import (Case, Count, Exists, IntegerField, OuterRef,
+                              Value, When)
+from django.db.models.functions import Lower
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import (FavouriteRecipe, Ingredient, Recipe, ShoppingCart,
+                            Tag)
 
 User = get_user_model()
 
+TAGS_MODE_ANY = "any"
+TAGS_MODE_ALL = "all"
+TAGS_MODES = (
+    (TAGS_MODE_ANY, "Любой из тегов"),
+    (TAGS_MODE_ALL, "Все теги"),
+)
+
 
 class IngredientFilter(FilterSet):
-    """Filter for ingredient."""
+    """Filter for ingredient.
+
+    Case-insensitive search by name: prefix matches go first, then
+    substring matches. LOWER(name) is backed by a pg_trgm GIN index.
+    """
 
-    name = filters.CharFilter(lookup_expr="startswith")
+    name = filters.CharFilter(method="filter_name")
 
     class Meta:
         model = Ingredient
         fields = ("name",)
 
+    def filter_name(self, queryset, name, value):
+        """Rank prefix matches above substring matches."""
+        value = value.lower()
+        return queryset.annotate(
+            lower_name=Lower("name")
+        ).filter(
+            lower_name__contains=value
+        ).annotate(
+            rank=Case(
+                When(lower_name__startswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by("rank", "name")
+
 
 class RecipeFilter(FilterSet):
-    """Filter for Recipe."""
+    """Filter for Recipe.
+
+    Tags are matched with a semi-join subquery on the recipe-tag table,
+    so recipes are never duplicated and no DISTINCT is needed. tags_mode
+    selects any-of (default) or all-of semantics.
+    """
 
     tags = filters.ModelMultipleChoiceFilter(
         field_name="tags__slug",
         to_field_name="slug",
         queryset=Tag.objects.all(),
+        method="filter_tags",
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES,
+        method="filter_tags_mode",
     )
 
     is_favorited = filters.BooleanFilter(
@@ -36,24 +76,48 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = (
             "tags",
+            "tags_mode",
             "author",
             "is_favorited",
             "is_in_shopping_cart",
         )
 
-    def __is_anonymous_or_in_db(self, queryset, name, value, related_field):
-        """Return queryset if user is anonymous or value exist."""
-        if self.request.user.is_anonymous:
-            return Recipe.objects.none() if value else queryset
-        objects = getattr(self.request.user, related_field).all()
-        return queryset.filter(pk__in=[item.recipe.pk for item in objects])
+    def filter_tags(self, queryset, name, value):
+        """Filter by a single subquery whatever the number of tags.
+
+        All-of keeps recipes having a row for every requested tag.
+        """
+        if not value:
+            return queryset
+        tags = {tag.pk for tag in value}
+        recipes = Recipe.tags.through.objects.filter(
+            tag__in=tags
+        ).values("recipe")
+        if self.form.cleaned_data.get("tags_mode") == TAGS_MODE_ALL:
+            recipes = recipes.annotate(
+                matched=Count("tag")
+            ).filter(matched=len(tags)).values("recipe")
+        return queryset.filter(pk__in=recipes)
+
+    def filter_tags_mode(self, queryset, name, value):
+        """Mode is applied by filter_tags."""
+        return queryset
+
+    def __is_anonymous_or_in_db(self, queryset, value, model):
+        """Keep recipes whose row in model does or does not exist.
+
+        Anonymous users have no rows, so true matches nothing.
+        """
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none() if value else queryset
+        in_db = Exists(model.objects.filter(user=user, recipe=OuterRef("pk")))
+        return queryset.filter(in_db if value else ~in_db)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """Boolean filter for shopping cart."""
-        return self.__is_anonymous_or_in_db(
-            queryset, name, value, "shopping_cart"
-        )
+        return self.__is_anonymous_or_in_db(queryset, value, ShoppingCart)
 
     def filter_is_favorited(self, queryset, name, value):
         """Boolean filter for favourite."""
-        return self.__is_anonymous_or_in_db(queryset, name, value, "favourite")
+        return self.__is_anonymous_or_in_db(queryset, value, FavouriteRecipe)
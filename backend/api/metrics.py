@@ -0,0 +1,93 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+from .profiling import get_view_label, wrap_queries
+
+UNMATCHED_VIEW = "unmatched"
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+REQUEST_LATENCY = Histogram(
+    "foodgram_request_duration_seconds",
+    "Request latency by view",
+    ["view", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "foodgram_request_db_queries",
+    "Database queries per request by view",
+    ["view"],
+    buckets=QUERY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "foodgram_cache_requests_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+PDF_RENDER_DURATION = Histogram(
+    "foodgram_pdf_render_seconds",
+    "Shopping list pdf render time",
+)
+
+
+def record_cache(name, hit):
+    """Count a lookup in the name cache as a hit or a miss."""
+    CACHE_REQUESTS.labels(name, "hit" if hit else "miss").inc()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Record latency and query count of every request by view.
+
+    Enabled by METRICS_ENABLED. Views are labelled by viewset action,
+    requests matching no view share one label.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_view = UNMATCHED_VIEW
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with wrap_queries(counter):
+            response = self.get_response(request)
+        REQUEST_LATENCY.labels(
+            request.metrics_view, request.method, response.status_code
+        ).observe(time.perf_counter() - start)
+        REQUEST_QUERIES.labels(request.metrics_view).observe(counter.count)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = get_view_label(view_func, request.method)
+
+
+def get_registry():
+    """Merge per-worker files when running under gunicorn workers."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """Export metrics in the Prometheus text format."""
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,150 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.models import TableVersion
+
+from .metrics import record_cache
+
+TABLE_STATE_ATTR = "_table_state"
+RESPONSE_CACHE_ALIAS = "responses"
+
+
+def get_table_state(request, names):
+    """Return TableVersion state of the tables, cached on the request."""
+    states = getattr(request, TABLE_STATE_ATTR, None)
+    if states is None:
+        states = {}
+        setattr(request, TABLE_STATE_ATTR, states)
+    key = tuple(sorted(names))
+    if key not in states:
+        states[key] = TableVersion.objects.get_state(key)
+    return states[key]
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified support with 304 responses for safe actions.
+
+    Validators are derived from TableVersion counters of version_tables,
+    so checking them costs one query instead of building the response.
+    """
+
+    version_tables = ()
+    conditional_actions = ("list", "retrieve")
+    cache_max_age = settings.HTTP_CACHE_MAX_AGE
+    vary_on_user = False
+
+    def get_etag_parts(self, request):
+        """Return values besides table versions that the response uses."""
+        return [request.get_full_path()]
+
+    def is_user_dependent(self, request):
+        return False
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        versions, last_modified = get_table_state(
+            request, self.version_tables
+        )
+        parts = [*sorted(versions.items()), *self.get_etag_parts(request)]
+        etag = quote_etag(
+            hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+        )
+        user_dependent = self.is_user_dependent(request)
+        if last_modified is not None and not user_dependent:
+            last_modified = int(last_modified.timestamp())
+        else:
+            last_modified = None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        if user_dependent:
+            patch_cache_control(response, private=True, max_age=0)
+        else:
+            patch_cache_control(
+                response, public=True, max_age=self.cache_max_age
+            )
+        if self.vary_on_user:
+            patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if "list" not in self.conditional_actions:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if "retrieve" not in self.conditional_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+
+class AnonymousResponseCacheMixin:
+    """Server-side cache of anonymous list and retrieve responses.
+
+    Keys hold the host, the normalized query string and a generation of
+    TableVersion counters of generation_tables. Any change bumps the
+    generation, so stale entries are never read again and are left to
+    the LRU eviction of the "responses" cache backend.
+    """
+
+    generation_tables = ()
+    cached_actions = ("list", "retrieve")
+
+    def get_response_cache_key(self, request):
+        versions, _ = get_table_state(request, self.generation_tables)
+        generation = "-".join(
+            str(versions[name]) for name in sorted(versions)
+        )
+        query = urlencode(sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            for value in values
+            if value
+        ))
+        digest = hashlib.md5(
+            f"{request.build_absolute_uri('/')}?{query}".encode("utf-8")
+        ).hexdigest()
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return f"{self.basename}:{self.action}:{lookup}:{generation}:{digest}"
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if (
+            self.action not in self.cached_actions
+            or request.user.is_authenticated
+        ):
+            return handler(request, *args, **kwargs)
+        cache = caches[RESPONSE_CACHE_ALIAS]
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        record_cache(RESPONSE_CACHE_ALIAS, data is not None)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
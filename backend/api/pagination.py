@@ -1,12 +1,92 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
 
 PAGE_SIZE = 6
 MAX_PAGE_SIZE = 20
+PAGINATION_QUERY_PARAM = "pagination"
+CURSOR_MODE = "cursor"
+COUNT_QUERY_PARAM = "count"
+FEED_ORDERING = ("-pub_date", "-id")
+
+
+def estimate_count(queryset):
+    """Return planner row estimate on PostgreSQL, exact count elsewhere.
+
+    QuerySet.explain() in Django 3.2 returns str() of the plan psycopg2
+    has already decoded, which is not JSON, so EXPLAIN is run directly.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class FeedCursorPagination(CursorPagination):
+    """Keyset pagination without COUNT(*) and OFFSET scans.
+
+    Ordering is taken from view cursor_ordering. Total count is skipped
+    unless requested with ?count=exact or ?count=estimate.
+    """
+
+    page_size = PAGE_SIZE
+    page_size_query_param = "limit"
+    max_page_size = MAX_PAGE_SIZE
+    ordering = FEED_ORDERING
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, "cursor_ordering", self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_mode = request.query_params.get(COUNT_QUERY_PARAM)
+        if count_mode == "exact":
+            self.count = queryset.count()
+        elif count_mode == "estimate":
+            self.count = estimate_count(queryset)
+        else:
+            self.count = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        content = [
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]
+        if self.count is not None:
+            content.insert(0, ("count", self.count))
+        return Response(OrderedDict(content))
 
 
 class CustomPageNumberPagination(PageNumberPagination):
-    """Custom pagination"""
+    """Custom pagination
+
+    ?pagination=cursor switches to FeedCursorPagination.
+    """
 
     page_size = PAGE_SIZE
     page_size_query_param = "limit"
     max_page_size = MAX_PAGE_SIZE
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(PAGINATION_QUERY_PARAM) == CURSOR_MODE:
+            self.cursor_paginator = FeedCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
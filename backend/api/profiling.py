@@ -0,0 +1,249 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+current_profile = ContextVar("current_profile", default=None)
+query_wrappers = ContextVar("query_wrappers", default=())
+
+DUPLICATES_REPORTED = 5
+FINGERPRINT_MAX_LENGTH = 300
+FINGERPRINT_PATTERNS = (
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\((?:(?:%s|\?), )+(?:%s|\?)\)"), "(...)"),
+)
+
+
+def fingerprint(sql):
+    """Return SQL with literals and IN lists collapsed."""
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql[:FINGERPRINT_MAX_LENGTH]
+
+
+@contextmanager
+def installed_query_wrappers(wrappers):
+    """Install execute wrappers on every connection of this thread."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            for wrapper in wrappers:
+                stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """Pass queries of the request to wrapper.
+
+    Connections are per thread, so the wrapper is also remembered for
+    async views, which install it in the pool thread serving the view.
+    """
+    token = query_wrappers.set(query_wrappers.get() + (wrapper,))
+    try:
+        with installed_query_wrappers((wrapper,)):
+            yield
+    finally:
+        query_wrappers.reset(token)
+
+
+def get_view_label(view_func, method):
+    """Return "ViewSet.action" for DRF views, the function name otherwise."""
+    view_class = getattr(view_func, "cls", None)
+    if view_class is None:
+        return f"{view_func.__module__}.{view_func.__name__}"
+    actions = getattr(view_func, "actions", None) or {}
+    return f"{view_class.__name__}.{actions.get(method.lower(), method)}"
+
+
+class RequestProfile:
+    """Timings and query fingerprints collected during one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.view = None
+        self.queries = Counter()
+        self.sections = defaultdict(float)
+        self.active = set()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        with self.section("db"):
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries[fingerprint(sql)] += 1
+
+    @contextmanager
+    def section(self, name):
+        """Add the time spent inside to name, ignoring nested entries."""
+        if name in self.active:
+            yield
+            return
+        self.active.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[name] += time.perf_counter() - start
+            self.active.discard(name)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def duplicates(self):
+        return [
+            {"sql": sql, "count": count}
+            for sql, count in self.queries.most_common(DUPLICATES_REPORTED)
+            if count > 1
+        ]
+
+    def server_timing(self):
+        """Format the profile as a Server-Timing header value."""
+        metrics = [
+            f'db;dur={self.sections["db"] * 1000:.1f};'
+            f'desc="{sum(self.queries.values())} queries"',
+            f'serialize;dur={self.sections["serialize"] * 1000:.1f}',
+            f'render;dur={self.sections["render"] * 1000:.1f}',
+            f"total;dur={self.duration * 1000:.1f}",
+        ]
+        duplicated = sum(item["count"] for item in self.duplicates())
+        if duplicated:
+            metrics.append(f'dup;desc="{duplicated} repeated queries"')
+        return ", ".join(metrics)
+
+    def as_dict(self, request, response):
+        return {
+            "view": self.view,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(self.duration * 1000, 3),
+            "queries": sum(self.queries.values()),
+            "db_ms": round(self.sections["db"] * 1000, 3),
+            "serialize_ms": round(self.sections["serialize"] * 1000, 3),
+            "render_ms": round(self.sections["render"] * 1000, 3),
+            "duplicates": self.duplicates(),
+        }
+
+
+@contextmanager
+def profile_section(name):
+    """Time a block into the current request profile if there is one."""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    with profile.section(name):
+        yield
+
+
+class ProfilingMiddleware:
+    """Opt-in profiler of a sample of requests.
+
+    Enabled by PROFILING_ENABLED; PROFILING_SAMPLE_RATE of requests get
+    a Server-Timing header and a JSON line in the api.profiling logger
+    with query count, DB time, repeated query fingerprints, serializer
+    and render time, labelled by viewset action.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            with wrap_queries(profile.execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        profile.finish()
+        response["Server-Timing"] = profile.server_timing()
+        logger.info(
+            json.dumps(profile.as_dict(request, response), ensure_ascii=False)
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.view = get_view_label(view_func, request.method)
+
+
+class ProfiledRenderer:
+    """Renderer proxy timing render() into the request profile."""
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+
+    def __getattr__(self, name):
+        return getattr(self.renderer, name)
+
+    def render(self, *args, **kwargs):
+        with profile_section("render"):
+            return self.renderer.render(*args, **kwargs)
+
+
+class ProfiledSerializerMixin:
+    def to_representation(self, instance):
+        with profile_section("serialize"):
+            return super().to_representation(instance)
+
+
+profiled_serializer_classes = {}
+
+
+def get_profiled_serializer_class(serializer_class):
+    """Return a cached subclass timing to_representation."""
+    profiled = profiled_serializer_classes.get(serializer_class)
+    if profiled is None:
+        profiled = type(
+            serializer_class.__name__,
+            (ProfiledSerializerMixin, serializer_class),
+            {"__module__": serializer_class.__module__},
+        )
+        profiled_serializer_classes[serializer_class] = profiled
+    return profiled
+
+
+class ProfilingMixin:
+    """Report serializer and render time of profiled requests."""
+
+    def get_serializer(self, *args, **kwargs):
+        if current_profile.get() is None:
+            return super().get_serializer(*args, **kwargs)
+        serializer_class = get_profiled_serializer_class(
+            self.get_serializer_class()
+        )
+        kwargs.setdefault("context", self.get_serializer_context())
+        return serializer_class(*args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if current_profile.get() is not None and isinstance(
+            response, Response
+        ):
+            response.accepted_renderer = ProfiledRenderer(
+                response.accepted_renderer
+            )
+        return response
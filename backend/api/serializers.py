@@ -1,18 +1,44 @@
 import base64
+from collections.abc import Mapping
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
 from recipes.models import (FavouriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag)
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
 from users.models import Follow
 
 User = get_user_model()
 
+FOLLOWED_AUTHOR_IDS_ATTR = "_followed_author_ids"
+BULK_ADD = "add"
+BULK_REMOVE = "remove"
+BULK_REPLACE = "replace"
+
+
+def get_followed_author_ids(request):
+    """Return ids of authors the request user follows.
+
+    The set is loaded with one query and cached on the request, so every
+    serializer rendering an author during the request shares it.
+    """
+    followed = getattr(request, FOLLOWED_AUTHOR_IDS_ATTR, None)
+    if followed is None:
+        followed = set(
+            Follow.objects.filter(user=request.user).values_list(
+                "author_id", flat=True
+            )
+        )
+        setattr(request, FOLLOWED_AUTHOR_IDS_ATTR, followed)
+    return followed
+
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
@@ -23,6 +49,76 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+        self.child_relation.resolve(data)
+        return [self.child_relation.to_internal_value(item) for item in data]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field able to resolve many values with one query.
+
+    After resolve() the field looks objects up in the loaded mapping
+    instead of querying the database for every value.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.resolved = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {"child_relation": cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+    def resolve(self, values):
+        """Load objects for all valid primary keys with in_bulk."""
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                continue
+        self.resolved = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if self.resolved is None:
+            return super().to_internal_value(data)
+        try:
+            pk = self.to_pk(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if pk not in self.resolved:
+            self.fail("does_not_exist", pk_value=data)
+        return self.resolved[pk]
+
+
+class BulkRelatedListSerializer(serializers.ListSerializer):
+    """List serializer resolving related fields of all items at once."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for field in self.child.fields.values():
+                if isinstance(field, BulkPrimaryKeyRelatedField):
+                    field.resolve(
+                        item.get(field.field_name) for item in data
+                        if isinstance(item, Mapping)
+                    )
+        return super().to_internal_value(data)
+
+
 class TagsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -70,9 +166,7 @@ class CustomUserSerializer(UserSerializer):
     def get_is_subscribed(self, obj):
         request = self.context.get("request")
         if request and request.user.is_authenticated:
-            return Follow.objects.filter(
-                user=request.user, author=obj
-            ).exists()
+            return obj.pk in get_followed_author_ids(request)
         return False
 
 
@@ -112,7 +206,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 
 class SubscriptionSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source="count_recipes")
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -128,17 +222,18 @@ class SubscriptionSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
-        author_recipes = Recipe.objects.filter(author=obj)
-
-        if "recipes_limit" in self.context.get("request").GET:
-            recipes_limit = self.context.get("request").GET["recipes_limit"]
-            author_recipes = author_recipes[: int(recipes_limit)]
+        author_recipes = getattr(obj, "limited_recipes", None)
+        if author_recipes is None:
+            author_recipes = Recipe.objects.filter(author=obj)
+            recipes_limit = self.context.get("recipes_limit")
+            if recipes_limit is not None:
+                author_recipes = author_recipes[:recipes_limit]
 
         return RecipeSerializer(author_recipes, many=True).data
 
 
 class RecipeCreateIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         source="ingredient",
         queryset=Ingredient.objects.all(),
     )
@@ -146,6 +241,7 @@ class RecipeCreateIngredientSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ("id", "amount")
         model = RecipeIngredient
+        list_serializer_class = BulkRelatedListSerializer
 
 
 class RecipeFillSerializer(serializers.ModelSerializer):
@@ -154,7 +250,7 @@ class RecipeFillSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     author = CustomUserSerializer(required=False)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
 
@@ -193,20 +289,17 @@ class RecipeFillSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Укажите больше 1 элемента",
             )
-        ingredients_list = []
+        ingredients_ids = set()
         for value in values:
-            ingredient = get_object_or_404(
-                Ingredient, id=value["ingredient"].id
-            )
             if int(value["amount"]) <= 0:
                 raise serializers.ValidationError(
                     {"Укажите количество больше 0"}
                 )
-            if ingredient in ingredients_list:
+            if value["ingredient"].pk in ingredients_ids:
                 raise serializers.ValidationError(
                     "Укажите уникальное значение"
                 )
-            ingredients_list.append(ingredient)
+            ingredients_ids.add(value["ingredient"].pk)
         return values
 
     def validate_tags(self, values):
@@ -214,13 +307,10 @@ class RecipeFillSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Выберите больше 1 тэга"
             )
-        tags_list: list = []
-        for tag in values:
-            if tag in tags_list:
-                raise serializers.ValidationError(
-                    "Укажите уникальное значение"
-                )
-            tags_list.append(tag)
+        if len({tag.pk for tag in values}) != len(values):
+            raise serializers.ValidationError(
+                "Укажите уникальное значение"
+            )
         return values
 
     @transaction.atomic
@@ -228,14 +318,15 @@ class RecipeFillSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
         obj = Recipe.objects.create(**validated_data)
-        obj.save()
         obj.tags.set(tags)
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=obj,
                 ingredient=ingredient["ingredient"],
                 amount=ingredient["amount"],
             )
+            for ingredient in ingredients
+        )
         return obj
 
     @transaction.atomic
@@ -247,16 +338,64 @@ class RecipeFillSerializer(serializers.ModelSerializer):
                 "Заполните все поля"
             )
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        for ingredient in ingredients:
-            RecipeIngredient.objects.update_or_create(
-                recipe=instance,
-                ingredient=ingredient["ingredient"],
-                amount=ingredient["amount"],
+        changed_ingredients = self.update_ingredients(instance, ingredients)
+        if changed_ingredients:
+            ShoppingListItem.objects.refresh(
+                ShoppingCart.objects.filter(recipe=instance).values("user"),
+                changed_ingredients,
             )
         return super().update(instance, validated_data)
 
+    @staticmethod
+    def update_ingredients(instance, ingredients):
+        """Write only the difference between stored and new ingredients.
+
+        Uses at most one delete, one insert and one update query and
+        returns ids of the ingredients that were touched.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in instance.recipe_ingredient.all()
+        }
+        amounts = {
+            ingredient["ingredient"].pk: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        removed = current.keys() - amounts.keys()
+        added = amounts.keys() - current.keys()
+        changed = [
+            item for ingredient_id, item in current.items()
+            if ingredient_id in amounts
+            and item.amount != amounts[ingredient_id]
+        ]
+        if removed:
+            instance.recipe_ingredient.filter(
+                ingredient__in=removed
+            ).delete()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=instance,
+                ingredient_id=ingredient_id,
+                amount=amounts[ingredient_id],
+            )
+            for ingredient_id in added
+        )
+        for item in changed:
+            item.amount = amounts[item.ingredient_id]
+        RecipeIngredient.objects.bulk_update(changed, ("amount",))
+        return removed | added | {item.ingredient_id for item in changed}
+
     def to_representation(self, instance):
+        """Render the saved recipe with its ingredient rows prefetched."""
+        prefetch_related_objects(
+            [instance],
+            Prefetch(
+                "recipe_ingredient",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+        )
         return RecipeReadSerializer(
             instance, context={"request": self.context.get("request")}
         ).data
@@ -288,7 +427,10 @@ class RecipeReadSerializer(serializers.ModelSerializer):
                   "is_in_shopping_cart"
                   )
 
-    def __is_auth_and_exists(self, obj, model):
+    def __is_auth_and_exists(self, obj, model, annotation):
+        """Use the flag annotated by the viewset, query only as a fallback."""
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
         request = self.context.get("request")
         if request and request.user.is_authenticated:
             return model.objects.filter(
@@ -297,7 +439,20 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_favorited(self, obj):
-        return self.__is_auth_and_exists(obj, FavouriteRecipe)
+        return self.__is_auth_and_exists(obj, FavouriteRecipe, "is_favorited")
 
     def get_is_in_shopping_cart(self, obj):
-        return self.__is_auth_and_exists(obj, ShoppingCart)
+        return self.__is_auth_and_exists(
+            obj, ShoppingCart, "is_in_shopping_cart"
+        )
+
+
+class RecipeBulkSerializer(serializers.Serializer):
+    """Batch of recipe ids to add to, remove from or replace a collection."""
+
+    action = serializers.ChoiceField(
+        choices=(BULK_ADD, BULK_REMOVE, BULK_REPLACE)
+    )
+    recipes = BulkPrimaryKeyRelatedField(
+        queryset=Recipe.objects.only("id"), many=True, allow_empty=True
+    )
@@ -0,0 +1,183 @@
+import csv
+import hashlib
+import io
+import json
+import tempfile
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .metrics import PDF_RENDER_DURATION, record_cache
+
+SHOPPINGCART_FILE = "shoppingcartlist"
+SHOPPINGCART_TITLE = "Продукты:"
+FONT_NAME = "firstime"
+FONT_FILE = "FirstTimeWriting.ttf"
+FONT_SIZE = 15
+PDF_LAYOUT_VERSION = 1
+PDF_CACHE_TIMEOUT = 60 * 60
+PDF_CACHE_MAX_SIZE = 512 * 1024
+PDF_SPOOL_MAX_SIZE = 512 * 1024
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+def register_font():
+    """Register the shopping list font, parsing the ttf file only once."""
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(FONT_NAME, str(settings.BASE_DIR / "data" / FONT_FILE))
+        )
+
+
+def get_cache_key(ingredients):
+    """Return cache key built from a hash of the aggregated ingredients."""
+    payload = json.dumps(
+        [PDF_LAYOUT_VERSION, ingredients],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"shopping_list_pdf:{digest}"
+
+
+def format_ingredient(index, ingredient):
+    """Return a numbered shopping list line for an aggregated row."""
+    return (
+        f'{index}. {ingredient["ingredient__name"]} - '
+        f'{ingredient["amount"]} '
+        f'{ingredient["ingredient__measurement_unit"]}.'
+    )
+
+
+def render_pdf(ingredients, output):
+    """Draw the shopping list into a binary file object."""
+    register_font()
+    page = canvas.Canvas(output)
+    x_position, y_position = 50, 800
+    indent = 20
+    page.setFont(FONT_NAME, FONT_SIZE)
+    page.drawString(x_position, y_position, SHOPPINGCART_TITLE)
+    for index, ingredient in enumerate(ingredients, start=1):
+        page.drawString(
+            x_position,
+            y_position - indent,
+            format_ingredient(index, ingredient),
+        )
+        y_position -= 15
+        if y_position <= 50:
+            page.showPage()
+            page.setFont(FONT_NAME, FONT_SIZE)
+            y_position = 800
+    page.save()
+
+
+def pdf_response(ingredients):
+    """Return the shopping list pdf, served from cache when unchanged.
+
+    The document is rendered into a spooled temporary file that moves to
+    disk once it outgrows PDF_SPOOL_MAX_SIZE and is streamed back in
+    chunks. Only documents up to PDF_CACHE_MAX_SIZE are cached.
+    """
+    ingredients = list(ingredients)
+    cache_key = get_cache_key(ingredients)
+    content = cache.get(cache_key)
+    record_cache("shopping_list_pdf", content is not None)
+    if content is not None:
+        output, size = io.BytesIO(content), len(content)
+    else:
+        output = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_SIZE)
+        with PDF_RENDER_DURATION.time():
+            render_pdf(ingredients, output)
+        size = output.tell()
+        output.seek(0)
+        if size <= PDF_CACHE_MAX_SIZE:
+            cache.set(cache_key, output.read(), PDF_CACHE_TIMEOUT)
+            output.seek(0)
+    response = FileResponse(
+        output, as_attachment=True, filename=f"{SHOPPINGCART_FILE}.pdf"
+    )
+    response["Content-Length"] = size
+    response.block_size = PDF_CHUNK_SIZE
+    return response
+
+
+class Echo:
+    """File-like object returning written value, used by csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def text_lines(ingredients):
+    yield f"{SHOPPINGCART_TITLE}\n"
+    for index, ingredient in enumerate(ingredients, start=1):
+        yield f"{format_ingredient(index, ingredient)}\n"
+
+
+def csv_lines(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("name", "measurement_unit", "amount"))
+    for ingredient in ingredients:
+        yield writer.writerow(
+            (
+                ingredient["ingredient__name"],
+                ingredient["ingredient__measurement_unit"],
+                ingredient["amount"],
+            )
+        )
+
+
+def json_lines(ingredients):
+    yield "["
+    for index, ingredient in enumerate(ingredients):
+        item = json.dumps(
+            {
+                "name": ingredient["ingredient__name"],
+                "measurement_unit": ingredient["ingredient__measurement_unit"],
+                "amount": ingredient["amount"],
+            },
+            ensure_ascii=False,
+        )
+        yield f",{item}" if index else item
+    yield "]"
+
+
+STREAM_FORMATS = {
+    "txt": (text_lines, "text/plain"),
+    "csv": (csv_lines, "text/csv"),
+    "json": (json_lines, "application/json"),
+}
+
+
+def fetch_rows(ingredients, buffered=False):
+    """Return an iterator over the rows, or None for an empty list.
+
+    The first row is read up front so an empty list is rejected before
+    streaming starts. Under ASGI the response is iterated in the event
+    loop where queries are not allowed, so buffered reads every row.
+    """
+    if buffered:
+        return list(ingredients) or None
+    rows = ingredients.iterator()
+    first = next(rows, None)
+    if first is None:
+        return None
+    return chain([first], rows)
+
+
+def stream_response(rows, format):
+    """Stream the shopping list as txt, csv or json, row by row."""
+    lines, content_type = STREAM_FORMATS[format]
+    response = StreamingHttpResponse(
+        lines(rows),
+        content_type=f"{content_type}; charset=utf-8",
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{SHOPPINGCART_FILE}.{format}"'
+    )
+    return response
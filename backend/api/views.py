@@ -1,40 +1,44 @@
-import io
-import os
-
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count
-from django.db.models.aggregates import Sum
-from django.http import FileResponse
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, Q, prefetch_related_objects
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import exceptions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import CreateAPIView
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 from recipes.models import (FavouriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag)
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, change_counter)
+from recipes.search import ingredient_index
 from users.models import Follow
 
+from .async_views import is_asgi_request
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPageNumberPagination
+from .mixins import AnonymousResponseCacheMixin, ConditionalGetMixin
+from .pagination import FEED_ORDERING, CustomPageNumberPagination
 from .permissions import CurrentUserOnly, RecipePermission
-from .serializers import (CustomUserCreateSerializer, IngredientSerialiser,
+from .profiling import ProfilingMixin
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .serializers import (BULK_ADD, BULK_REMOVE, CustomUserCreateSerializer,
+                          IngredientSerialiser, RecipeBulkSerializer,
                           RecipeFillSerializer, RecipeReadSerializer,
                           RecipeSerializer, SubscriptionSerializer,
-                          TagsSerializer)
+                          TagsSerializer, get_followed_author_ids)
+from .shopping_list import (STREAM_FORMATS, fetch_rows, pdf_response,
+                            stream_response)
 
 User = get_user_model()
 
-SHOPPINGCART_FILE = "shoppingcartlist.pdf"
-
 
-class CustomUserCreateView(CreateAPIView):
+class CustomUserCreateView(ProfilingMixin, CreateAPIView):
     serializer_class = CustomUserCreateSerializer
 
     def post(self, request, *args, **kwargs):
@@ -45,21 +49,82 @@ class CustomUserCreateView(CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+class TagsViewSet(
+    ProfilingMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Tag.objects.all()
     serializer_class = TagsSerializer
+    version_tables = ("tags",)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ProfilingMixin,
+    ConditionalGetMixin,
+    AnonymousResponseCacheMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Recipe.objects.select_related("author").prefetch_related(
-        "tags", "ingredients")
+        "tags",
+        Prefetch(
+            "recipe_ingredient",
+            queryset=RecipeIngredient.objects.select_related("ingredient"),
+        ),
+    )
     permission_classes = (RecipePermission,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = CustomPageNumberPagination
+    cursor_ordering = FEED_ORDERING
+    version_tables = generation_tables = (
+        "recipes", "tags", "ingredients", "users"
+    )
+    conditional_actions = ("retrieve",)
+    cache_max_age = 0
+    vary_on_user = True
 
+    def get_queryset(self):
+        return super().get_queryset().with_user_flags(self.request.user)
+
+    def is_user_dependent(self, request):
+        return request.user.is_authenticated
+
+    def get_etag_parts(self, request):
+        parts = super().get_etag_parts(request)
+        if request.user.is_authenticated:
+            try:
+                flags = self.get_queryset().filter(
+                    pk=self.kwargs[self.lookup_field]
+                ).values_list(
+                    "author", "is_favorited", "is_in_shopping_cart"
+                ).first()
+            except (TypeError, ValueError, DjangoValidationError):
+                raise Http404
+            parts += [
+                request.user.pk,
+                flags,
+                bool(flags) and flags[0] in get_followed_author_ids(request),
+            ]
+        return parts
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        change_counter(
+            User.objects.filter(pk=self.request.user.pk), "recipes_count", 1
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        users = list(instance.shopping_cart.values_list("user", flat=True))
+        ingredients = list(
+            instance.recipe_ingredient.values_list("ingredient", flat=True)
+        )
+        super().perform_destroy(instance)
+        change_counter(
+            User.objects.filter(pk=instance.author_id), "recipes_count", -1
+        )
+        if users:
+            ShoppingListItem.objects.refresh(users, ingredients)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -71,6 +136,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=["post", "delete"],
         permission_classes=[IsAuthenticated],
     )
+    @transaction.atomic
     def favorite(self, request, pk):
         if request.method == "POST":
             return self.add_to(FavouriteRecipe, request.user, pk)
@@ -81,79 +147,157 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=["post", "delete"],
         permission_classes=[IsAuthenticated],
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         if request.method == "POST":
-            return self.add_to(ShoppingCart, request.user, pk)
-        return self.delete_from(ShoppingCart, request.user, pk)
+            response = self.add_to(ShoppingCart, request.user, pk)
+        else:
+            response = self.delete_from(ShoppingCart, request.user, pk)
+        if status.is_success(response.status_code):
+            ShoppingListItem.objects.refresh_recipes([request.user], [pk])
+        return response
+
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[IsAuthenticated],
+        url_path="favorite/bulk",
+        url_name="favorite-bulk",
+    )
+    def favorite_bulk(self, request):
+        return self.update_links(FavouriteRecipe, request)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[IsAuthenticated],
+        url_path="shopping_cart/bulk",
+        url_name="shopping-cart-bulk",
+    )
+    def shopping_cart_bulk(self, request):
+        return self.update_links(ShoppingCart, request)
 
     @staticmethod
-    def generate_pdf(ingredients):
-        buffer = io.BytesIO()
-        page = canvas.Canvas(buffer)
-        x_position, y_position = 50, 800
-        file_path = os.path.abspath("./data/")
-        pdfmetrics.registerFont(TTFont("firstime",
-                                       f"{file_path}/FirstTimeWriting.ttf"))
-        page.setFont("firstime", 15)
-        if not ingredients:
-            return Response({"error": "Отсутствуют ингредиенты"},
-                            status=status.HTTP_400_BAD_REQUEST)
-        indent = 20
-        page.drawString(x_position, y_position, "Продукты:")
-        for index, ingredient in enumerate(ingredients, start=1):
-            page.drawString(
-                x_position,
-                y_position - indent,
-                f'{index}. {ingredient["ingredient__name"]} - '
-                f'{ingredient["amount"]} '
-                f'{ingredient["ingredient__measurement_unit"]}.',
-            )
-            y_position -= 15
-            if y_position <= 50:
-                page.showPage()
-                y_position = 800
-        page.save()
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True,
-                            filename=SHOPPINGCART_FILE)
+    @transaction.atomic
+    def update_links(model, request):
+        """Add, remove or replace many recipes of the user at once."""
+        serializer = RecipeBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = {
+            recipe.pk for recipe in serializer.validated_data["recipes"]
+        }
+        added, removed, touched = set(), 0, recipes
+        if serializer.validated_data["action"] == BULK_ADD:
+            added = model.objects.add(request.user, recipes)
+        elif serializer.validated_data["action"] == BULK_REMOVE:
+            removed = model.objects.remove(request.user, recipes)
+        else:
+            added, stale = model.objects.replace(request.user, recipes)
+            removed, touched = len(stale), recipes | stale
+        if model is ShoppingCart and (added or removed):
+            ShoppingListItem.objects.refresh_recipes([request.user], touched)
+        return Response({"added": len(added), "removed": removed})
 
     @action(
-        detail=False, methods=["get"], permission_classes=(IsAuthenticated,)
+        detail=False,
+        methods=["get"],
+        cursor_ordering=("-popularity", "-id"),
+    )
+    def popular(self, request):
+        """Recipes ordered by the score of refresh_recipe_scores."""
+        queryset = self.filter_queryset(
+            self.get_queryset().filter(score__isnull=False)
+        ).annotate(
+            popularity=F("score__score")
+        ).order_by("-popularity", "-id")
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            PDFRenderer, PlainTextRenderer, CSVRenderer, JSONRenderer
+        ),
     )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
         ).values(
             "ingredient__name",
-            "ingredient__measurement_unit"
-        ).annotate(
-            amount=Sum("amount")
-        )
-        return self.generate_pdf(ingredients)
+            "ingredient__measurement_unit",
+            amount=F("total_amount"),
+        ).order_by("ingredient__name")
+        format = request.accepted_renderer.format
+        if format in STREAM_FORMATS:
+            rows = fetch_rows(
+                ingredients,
+                buffered=is_asgi_request(request),
+            )
+        else:
+            rows = list(ingredients)
+        if not rows:
+            return Response({"error": "Отсутствуют ингредиенты"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if format in STREAM_FORMATS:
+            return stream_response(rows, format)
+        return pdf_response(rows)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Render errors of the shopping list download as json.
+
+        The list itself is never a DRF Response, so any Response here
+        is an error that must not be labelled with the list format.
+        """
+        if self.action == "download_shopping_cart" and isinstance(
+            response, Response
+        ):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
 
     @staticmethod
     def add_to(model, user: User, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+        """Insert the link and let the unique constraint reject repeats."""
+        try:
+            recipe = Recipe.objects.get(id=pk)
+        except (Recipe.DoesNotExist, TypeError, ValueError,
+                DjangoValidationError):
             return Response(
-                {"errors": "Рецепт уже существует"},
+                {"errors": "Такого рецепта нет"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        if not Recipe.objects.filter(id=pk).exists():
+        try:
+            with transaction.atomic():
+                model.objects.create(user=user, recipe=recipe)
+        except IntegrityError:
             return Response(
-                {"errors": "Такого рецепта нет"},
+                {"errors": "Рецепт уже существует"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        recipe = Recipe.objects.get(id=pk)
-        model.objects.create(user=user, recipe=recipe)
+        change_counter(
+            Recipe.objects.filter(pk=recipe.pk), model.counter_field, 1
+        )
         serializer = RecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
     def delete_from(model, user, pk):
-        queryset = model.objects.filter(user=user, recipe__id=pk)
-        delete_count, _ = queryset.delete()
+        try:
+            delete_count, _ = model.objects.filter(
+                user=user, recipe__id=pk
+            ).delete()
+        except (TypeError, ValueError, DjangoValidationError):
+            delete_count = 0
 
         if delete_count > 0:
+            change_counter(
+                Recipe.objects.filter(pk=pk),
+                model.counter_field,
+                -delete_count,
+            )
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(
@@ -162,16 +306,98 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
 
-class IngredientsVewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsVewSet(
+    ProfilingMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerialiser
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    version_tables = ("ingredients",)
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == "list" and self.request.query_params.get("name"):
+            return queryset[:settings.INGREDIENT_SEARCH_LIMIT]
+        return queryset
 
-class CustomUserViewSet(UserViewSet):
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if name and settings.INGREDIENT_INDEX_ENABLED:
+            return self.conditional_response(request, self.search, name)
+        return super().list(request, *args, **kwargs)
+
+    def search(self, request, name):
+        return Response(
+            ingredient_index.search(name, settings.INGREDIENT_SEARCH_LIMIT)
+        )
+
+
+class CustomUserViewSet(ProfilingMixin, UserViewSet):
     queryset = User.objects.all()
     pagination_class = CustomPageNumberPagination
+    cursor_ordering = ("username",)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        recipes = list(
+            Recipe.objects.filter(
+                Q(favourite__user=instance) | Q(shopping_cart__user=instance)
+            ).values_list("pk", flat=True).distinct()
+        )
+        # Carts of other users lose the author's recipes in the cascade
+        carts = ShoppingCart.objects.filter(recipe__author=instance).exclude(
+            user=instance
+        )
+        users = list(carts.values_list("user", flat=True).distinct())
+        ingredients = list(
+            RecipeIngredient.objects.filter(
+                recipe__shopping_cart__in=carts
+            ).values_list("ingredient", flat=True).distinct()
+        )
+        super().perform_destroy(instance)
+        Recipe.objects.filter(pk__in=recipes).recount()
+        if users:
+            ShoppingListItem.objects.refresh(users, ingredients)
+
+    def get_recipes_limit(self):
+        """Return validated recipes_limit query parameter or None."""
+        recipes_limit = self.request.query_params.get("recipes_limit")
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise exceptions.ValidationError(
+                {"recipes_limit": "Укажите целое неотрицательное число"}
+            )
+        return recipes_limit
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ("subscriptions", "subscribe"):
+            context["recipes_limit"] = self.get_recipes_limit()
+        return context
+
+    def prefetch_subscription_recipes(self, authors):
+        """Load recipes of the authors of a page in one query.
+
+        recipes_limit is applied by ranking the recipes of these authors
+        only, once, instead of a subquery per recipe row.
+        """
+        recipes = Recipe.objects.all()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.latest_by_author(
+                [author.pk for author in authors], recipes_limit
+            )
+        prefetch_related_objects(
+            authors,
+            Prefetch("recipe", queryset=recipes, to_attr="limited_recipes"),
+        )
+        return authors
 
     @action(
         detail=False,
@@ -181,10 +407,11 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = self.request.user
-        authors = User.objects.filter(following__user=user).annotate(
-            count_recipes=Count("recipe"))
-        paginated_queryset = self.paginate_queryset(authors)
-        serializer = self.get_serializer(paginated_queryset, many=True)
+        authors = self.paginate_queryset(
+            User.objects.filter(following__user=user).order_by("username")
+        )
+        self.prefetch_subscription_recipes(authors)
+        serializer = self.get_serializer(authors, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -205,6 +432,7 @@ class CustomUserViewSet(UserViewSet):
             if Follow.objects.filter(user=user, author=author).exists():
                 raise exceptions.ValidationError("Подписка уже активна")
             Follow.objects.create(user=user, author=author)
+            self.prefetch_subscription_recipes([author])
             serializer = self.get_serializer(author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
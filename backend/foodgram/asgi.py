@@ -3,5 +3,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
+os.environ.setdefault("FOODGRAM_ROOT_URLCONF", "foodgram.asgi_urls")
 
 application = get_asgi_application()
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from django.urls import include, path
+
+from api.metrics import metrics_view
+
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("api/", include("api.asgi_urls")),
+    path("metrics", metrics_view, name="metrics"),
+]
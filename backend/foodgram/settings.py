@@ -29,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.MetricsMiddleware",
+    "api.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -38,7 +40,7 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-ROOT_URLCONF = "foodgram.urls"
+ROOT_URLCONF = os.getenv("FOODGRAM_ROOT_URLCONF", "foodgram.urls")
 
 TEMPLATES = [
     {
@@ -70,6 +72,25 @@ DATABASES = {
 }
 
 
+RESPONSE_CACHE_BACKEND = os.getenv(
+    "RESPONSE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        "BACKEND": RESPONSE_CACHE_BACKEND,
+        "LOCATION": os.getenv("RESPONSE_CACHE_LOCATION", "responses"),
+        "TIMEOUT": int(os.getenv("RESPONSE_CACHE_TIMEOUT", 300)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+        } if RESPONSE_CACHE_BACKEND.endswith("LocMemCache") else {},
+    },
+}
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -112,6 +133,41 @@ REST_FRAMEWORK = {
     ],
 }
 
+INGREDIENT_SEARCH_LIMIT = int(os.getenv("INGREDIENT_SEARCH_LIMIT", 50))
+
+INGREDIENT_INDEX_ENABLED = os.getenv("INGREDIENT_INDEX_ENABLED", "True") == "True"
+
+INGREDIENT_INDEX_TTL = float(os.getenv("INGREDIENT_INDEX_TTL", 5))
+
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", 60))
+
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", 7))
+
+POPULARITY_WINDOW_DAYS = int(os.getenv("POPULARITY_WINDOW_DAYS", 90))
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False") == "True"
+
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0.01))
+
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", 8))
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False") == "True"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api.profiling": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "SERIALIZERS": {
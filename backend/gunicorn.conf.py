@@ -0,0 +1,24 @@
+import os
+import shutil
+
+bind = "0.0.0.0:9000"
+
+# Workers write metrics to files in this directory and /metrics merges
+# them. prometheus_client picks file-backed values on import, so the
+# variable is set before anything imports it.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/foodgram_metrics"
+)
+
+
+def on_starting(server):
+    """Drop metrics files left from a previous run."""
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    """Stop reporting live values of a worker that exited."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.contrib.auth import get_user_model
 
 from .models import (FavouriteRecipe, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag, recount_authors)
+
+User = get_user_model()
 
 
 class RecipeIngredientAdmin(admin.StackedInline):
@@ -15,6 +18,7 @@ class RecipeAdmin(admin.ModelAdmin):
         "name",
         "author",
         "get_favorite_count",
+        "in_carts_count",
     )
     search_fields = (
         "name",
@@ -29,13 +33,59 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientAdmin,)
 
     def get_queryset(self, request):
-        qs = super(RecipeAdmin, self).queryset(request)
+        qs = super().get_queryset(request)
         return qs.select_related("author").prefetch_related(
             "tags", "ingredients")
 
-    @admin.display(description="Избранное")
+    @admin.display(description="Избранное", ordering="favorites_count")
     def get_favorite_count(self, obj):
-        return obj.favourite.count()
+        return obj.favorites_count
+
+    def save_model(self, request, obj, form, change):
+        authors = [obj.author_id]
+        if change:
+            authors.append(form.initial["author"])
+        super().save_model(request, obj, form, change)
+        recount_authors(User.objects.filter(pk__in=authors))
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.objects.refresh(
+            form.instance.shopping_cart.values("user")
+        )
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Recipe.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        users = list(
+            ShoppingCart.objects.filter(recipe__in=queryset).values_list(
+                "user", flat=True
+            )
+        )
+        authors = list(queryset.values_list("author", flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.refresh(users)
+        recount_authors(User.objects.filter(pk__in=authors))
+
+
+class RecipeCounterAdmin(admin.ModelAdmin):
+    """Keep Recipe counters in sync with the edited relation rows."""
+
+    def save_model(self, request, obj, form, change):
+        recipes = [obj.recipe_id]
+        if change:
+            recipes.append(form.initial["recipe"])
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(pk__in=recipes).recount()
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, self.model.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        recipes = list(queryset.values_list("recipe", flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipes).recount()
 
 
 @admin.register(Tag)
@@ -46,7 +96,7 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(FavouriteRecipe)
-class FavoriteRecipeAdmin(admin.ModelAdmin):
+class FavoriteRecipeAdmin(RecipeCounterAdmin):
     list_display = ("id", "user", "recipe")
     search_fields = ("user__username", "recipe__name")
     list_filter = ("user__username", "recipe__name")
@@ -74,7 +124,7 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(RecipeCounterAdmin):
     list_display = (
         "user",
         "recipe",
@@ -91,3 +141,15 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.select_related("user", "recipe")
+
+    def save_model(self, request, obj, form, change):
+        users = [obj.user_id]
+        if change:
+            users.append(form.initial["user"])
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.refresh(users)
+
+    def delete_queryset(self, request, queryset):
+        users = list(queryset.values_list("user", flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.refresh(users)
@@ -0,0 +1,71 @@
+import statistics
+import time
+from typing import Callable, List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.filters import IngredientFilter
+from recipes.models import Ingredient
+from recipes.search import ingredient_index
+
+
+class Command(BaseCommand):
+    """Custom command comparing ingredient autocomplete implementations."""
+    help: str = (
+        "Benchmark in-memory ingredient index against IngredientFilter"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--queries",
+            type=int,
+            default=200,
+            help="Number of autocomplete queries per implementation",
+        )
+
+    def handle(self, *args, **options) -> None:
+        """Run both implementations over the same queries and report."""
+        names: List[str] = list(
+            Ingredient.objects.values_list("name", flat=True)[
+                :options["queries"]
+            ]
+        )
+        if not names:
+            raise CommandError("Load ingredients first")
+        queries: List[str] = [
+            name[:length] for name in names for length in (1, 2, 3)
+        ][:options["queries"]]
+        limit: int = settings.INGREDIENT_SEARCH_LIMIT
+        ingredient_index.load()
+        for label, search in (
+            ("IngredientFilter", lambda value: filter_search(value, limit)),
+            ("IngredientIndex", lambda value: ingredient_index.search(
+                value, limit
+            )),
+        ):
+            self.stdout.write(f"{label}: {report(search, queries)}")
+
+
+def filter_search(value: str, limit: int) -> list:
+    """Run the database backed IngredientFilter path."""
+    return list(
+        IngredientFilter(
+            {"name": value}, queryset=Ingredient.objects.all()
+        ).qs.values("id", "name", "measurement_unit")[:limit]
+    )
+
+
+def report(search: Callable, queries: List[str]) -> str:
+    """Time search for every query and format mean and p95 latency."""
+    timings: List[float] = []
+    for value in queries:
+        start: float = time.perf_counter()
+        search(value)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95: float = timings[int(len(timings) * 0.95) - 1]
+    return (
+        f"{len(timings)} queries, mean {statistics.mean(timings):.3f} ms, "
+        f"p95 {p95:.3f} ms"
+    )
@@ -0,0 +1,142 @@
+import random
+from typing import Callable, List
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import QuerySet
+from django_filters.rest_framework import filters
+
+from api.filters import TAGS_MODE_ALL, TAGS_MODE_ANY, RecipeFilter
+from recipes.management.commands.bench_ingredient_search import report
+from recipes.models import Recipe, Tag
+
+User = get_user_model()
+
+PAGE_SIZE = 6
+BATCH_SIZE = 1000
+
+
+class JoinRecipeFilter(RecipeFilter):
+    """Previous tags filter: OR over the M2M join plus DISTINCT."""
+
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name="tags__slug",
+        to_field_name="slug",
+        queryset=Tag.objects.all(),
+    )
+
+
+class Command(BaseCommand):
+    """Custom command comparing recipe tag filter implementations."""
+    help: str = (
+        "Benchmark subquery based tag filtering against the M2M join "
+        "on a seeded dataset, rolled back afterwards"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--recipes", type=int, default=20000,
+            help="Number of seeded recipes",
+        )
+        parser.add_argument(
+            "--tags", type=int, default=100,
+            help="Number of seeded tags",
+        )
+        parser.add_argument(
+            "--tags-per-recipe", type=int, default=5,
+            help="Tags attached to every seeded recipe",
+        )
+        parser.add_argument(
+            "--queries", type=int, default=100,
+            help="Number of filtered feed requests per implementation",
+        )
+
+    def handle(self, *args, **options) -> None:
+        """Seed data, time every implementation, then roll back."""
+        rng = random.Random(0)
+        with transaction.atomic():
+            slugs: List[str] = seed(
+                options["recipes"],
+                options["tags"],
+                options["tags_per_recipe"],
+                rng,
+            )
+            queries: List[List[str]] = [
+                rng.sample(slugs, rng.randint(2, 4))
+                for _ in range(options["queries"])
+            ]
+            for label, search in (
+                ("M2M join + DISTINCT", lambda value: filter_search(
+                    JoinRecipeFilter, value, TAGS_MODE_ANY
+                )),
+                ("Subquery any", lambda value: filter_search(
+                    RecipeFilter, value, TAGS_MODE_ANY
+                )),
+                ("Subquery all", lambda value: filter_search(
+                    RecipeFilter, value, TAGS_MODE_ALL
+                )),
+            ):
+                self.stdout.write(f"{label}: {report(feed(search), queries)}")
+            transaction.set_rollback(True)
+
+
+def seed(recipes: int, tags: int, tags_per_recipe: int, rng) -> List[str]:
+    """Create an author, tags and tagged recipes; return tag slugs."""
+    author = User.objects.create_user(
+        username="bench_tag_filter",
+        email="bench_tag_filter@example.com",
+        first_name="bench",
+        last_name="bench",
+    )
+    created_tags = Tag.objects.bulk_create(
+        Tag(name=f"bench-{i}", slug=f"bench-{i}", color="#000000")
+        for i in range(tags)
+    )
+    tag_ids: List[int] = list(
+        Tag.objects.filter(
+            slug__in=[tag.slug for tag in created_tags]
+        ).values_list("pk", flat=True)
+    )
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author=author,
+                name=f"bench-{i}",
+                text="bench",
+                cooking_time=1,
+                image="recipes/bench.png",
+            )
+            for i in range(recipes)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    RecipeTag = Recipe.tags.through
+    RecipeTag.objects.bulk_create(
+        (
+            RecipeTag(recipe_id=recipe, tag_id=tag)
+            for recipe in Recipe.objects.filter(
+                author=author
+            ).values_list("pk", flat=True).iterator()
+            for tag in rng.sample(tag_ids, min(tags_per_recipe, len(tag_ids)))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    return [tag.slug for tag in created_tags]
+
+
+def filter_search(
+    filterset_class: type, slugs: List[str], mode: str
+) -> QuerySet:
+    """Filter recipes by the slugs with the given tags_mode."""
+    data = {"tags": slugs, "tags_mode": mode}
+    return filterset_class(data, queryset=Recipe.objects.all()).qs
+
+
+def feed(search: Callable) -> Callable:
+    """Wrap search into count plus first page, like the feed does."""
+    def run(slugs: List[str]) -> None:
+        queryset = search(slugs)
+        queryset.count()
+        list(queryset.values_list("pk", flat=True)[:PAGE_SIZE])
+    return run
@@ -0,0 +1,433 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.management.commands.seed_data import SEED_PASSWORD, SEED_PREFIX
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+BASELINE_FILE = str(settings.BASE_DIR / "api_baseline.json")
+MEMORY_ITERATIONS = 3
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+# name, method, url, body factory, expected status, authenticated
+Route = Tuple[str, str, str, Optional[Callable[[dict], dict]], int, bool]
+
+
+def recipe_body(context: dict) -> dict:
+    """Body of a recipe with a few ingredients."""
+    return {
+        "ingredients": [
+            {"id": ingredient, "amount": 10}
+            for ingredient in context["ingredients"]
+        ],
+        "tags": [context["tag"]],
+        "image": IMAGE,
+        "name": "Рецепт для замера",
+        "text": "Описание",
+        "cooking_time": 10,
+    }
+
+
+def user_body(context: dict) -> dict:
+    """Body of a not yet registered user."""
+    context["new_users"] += 1
+    name = f"{SEED_PREFIX}bench_{context['new_users']}"
+    return {
+        "email": f"{name}@example.com",
+        "username": name,
+        "first_name": "Bench",
+        "last_name": "User",
+        "password": "Bench-password-42",
+    }
+
+
+# Routes are run in this order on every iteration. Writes are paired
+# with their undo so every iteration starts from the same state.
+ROUTES: List[Route] = [
+    ("tags-list", "get", "/api/tags/", None, 200, False),
+    ("tags-detail", "get", "/api/tags/{tag}/", None, 200, False),
+    ("ingredients-list", "get", "/api/ingredients/", None, 200, False),
+    (
+        "ingredients-search", "get", "/api/ingredients/?name={prefix}",
+        None, 200, False,
+    ),
+    (
+        "ingredients-detail", "get", "/api/ingredients/{ingredient}/",
+        None, 200, False,
+    ),
+    ("recipes-list-anonymous", "get", "/api/recipes/", None, 200, False),
+    ("recipes-list", "get", "/api/recipes/", None, 200, True),
+    (
+        "recipes-list-cursor", "get", "/api/recipes/?pagination=cursor",
+        None, 200, True,
+    ),
+    (
+        "recipes-list-filtered", "get",
+        "/api/recipes/?tags={tag_slug}&is_favorited=1", None, 200, True,
+    ),
+    ("recipes-popular", "get", "/api/recipes/popular/", None, 200, True),
+    ("recipes-detail", "get", "/api/recipes/{recipe}/", None, 200, True),
+    ("recipes-create", "post", "/api/recipes/", recipe_body, 201, True),
+    (
+        "recipes-update", "patch", "/api/recipes/{created_recipe}/",
+        recipe_body, 200, True,
+    ),
+    (
+        "recipes-delete", "delete", "/api/recipes/{created_recipe}/",
+        None, 204, True,
+    ),
+    (
+        "favorite-add", "post", "/api/recipes/{other_recipe}/favorite/",
+        None, 201, True,
+    ),
+    (
+        "favorite-remove", "delete", "/api/recipes/{other_recipe}/favorite/",
+        None, 204, True,
+    ),
+    (
+        "shopping-cart-add", "post",
+        "/api/recipes/{other_recipe}/shopping_cart/", None, 201, True,
+    ),
+    (
+        "shopping-cart-remove", "delete",
+        "/api/recipes/{other_recipe}/shopping_cart/", None, 204, True,
+    ),
+    (
+        "shopping-cart-bulk-add", "post", "/api/recipes/shopping_cart/bulk/",
+        lambda context: {"action": "add", "recipes": context["bulk"]},
+        200, True,
+    ),
+    (
+        "shopping-cart-bulk-remove", "post",
+        "/api/recipes/shopping_cart/bulk/",
+        lambda context: {"action": "remove", "recipes": context["bulk"]},
+        200, True,
+    ),
+    (
+        "favorite-bulk-add", "post", "/api/recipes/favorite/bulk/",
+        lambda context: {"action": "add", "recipes": context["bulk"]},
+        200, True,
+    ),
+    (
+        "favorite-bulk-remove", "post", "/api/recipes/favorite/bulk/",
+        lambda context: {"action": "remove", "recipes": context["bulk"]},
+        200, True,
+    ),
+    (
+        "download-pdf", "get", "/api/recipes/download_shopping_cart/",
+        None, 200, True,
+    ),
+    (
+        "download-txt", "get",
+        "/api/recipes/download_shopping_cart/?format=txt", None, 200, True,
+    ),
+    (
+        "download-csv", "get",
+        "/api/recipes/download_shopping_cart/?format=csv", None, 200, True,
+    ),
+    ("users-list", "get", "/api/users/", None, 200, True),
+    ("users-detail", "get", "/api/users/{author}/", None, 200, True),
+    ("users-me", "get", "/api/users/me/", None, 200, True),
+    ("users-create", "post", "/api/users/", user_body, 201, False),
+    (
+        "subscriptions", "get", "/api/users/subscriptions/?recipes_limit=3",
+        None, 200, True,
+    ),
+    (
+        "subscribe", "post", "/api/users/{other_author}/subscribe/",
+        None, 201, True,
+    ),
+    (
+        "unsubscribe", "delete", "/api/users/{other_author}/subscribe/",
+        None, 204, True,
+    ),
+    (
+        "token-login", "post", "/api/auth/token/login/",
+        lambda context: {
+            "email": context["email"], "password": SEED_PASSWORD,
+        },
+        200, False,
+    ),
+]
+
+
+class Command(BaseCommand):
+    """Custom command benchmarking every API route on seeded data."""
+    help: str = (
+        "Request every API route as the busiest seed_data user inside a "
+        "rolled-back transaction. Record query count, median wall time "
+        "and peak Python memory per route, and fail when a route is "
+        "slower, heavier or runs more queries than the stored baseline"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--iterations", type=int, default=5,
+            help="Timed runs over all routes",
+        )
+        parser.add_argument(
+            "--baseline", default=BASELINE_FILE,
+            help="Path of the baseline JSON file",
+        )
+        parser.add_argument(
+            "--update-baseline", action="store_true",
+            help="Store the results as the new baseline",
+        )
+        parser.add_argument(
+            "--queries-only", action="store_true",
+            help="Store and compare query counts only, times and memory "
+            "depend on the machine",
+        )
+        parser.add_argument(
+            "--time-tolerance", type=float, default=0.5,
+            help="Allowed relative wall time growth",
+        )
+        parser.add_argument(
+            "--time-slack", type=float, default=5.0,
+            help="Wall time growth in ms always allowed, absorbs jitter",
+        )
+        parser.add_argument(
+            "--memory-tolerance", type=float, default=0.25,
+            help="Allowed relative peak memory growth",
+        )
+        parser.add_argument(
+            "--memory-slack", type=float, default=64.0,
+            help="Peak memory growth in KiB always allowed",
+        )
+
+    @override_settings(
+        ALLOWED_HOSTS=["testserver"],
+        CACHES={
+            alias: {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": f"benchmark_api_{alias}",
+            }
+            for alias in ("default", "responses")
+        },
+    )
+    def handle(self, *args, **options) -> None:
+        """Run the routes, print results and compare with the baseline."""
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be positive")
+        # Uploaded images are not rolled back with the transaction
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root
+        ), transaction.atomic():
+            context: dict = get_context()
+            results: Dict[str, dict] = run(context, options["iterations"])
+            transaction.set_rollback(True)
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:28} {result['queries']:4} queries "
+                f"{result['time_ms']:9.2f} ms {result['peak_kb']:9.1f} KiB"
+            )
+        if options["queries_only"]:
+            results = {
+                name: {"queries": result["queries"]}
+                for name, result in results.items()
+            }
+        if options["update_baseline"]:
+            with open(options["baseline"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write("\n")
+            self.stdout.write(
+                self.style.SUCCESS(f"Baseline saved to {options['baseline']}")
+            )
+            return
+        if not os.path.exists(options["baseline"]):
+            raise CommandError(
+                f"{options['baseline']} not found, run with --update-baseline"
+            )
+        with open(options["baseline"], encoding="utf-8") as f:
+            baseline: Dict[str, dict] = json.load(f)
+        regressions: List[str] = compare(
+            results,
+            baseline,
+            options["time_tolerance"],
+            options["time_slack"],
+            options["memory_tolerance"],
+            options["memory_slack"],
+        )
+        if regressions:
+            raise CommandError("\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions"))
+
+
+def get_context() -> dict:
+    """Pick the busiest seed user and the objects the routes need."""
+    reader = User.objects.filter(
+        username__startswith=SEED_PREFIX
+    ).annotate(
+        follows=Count("follower", distinct=True),
+        carts=Count("shopping_cart", distinct=True),
+    ).filter(carts__gt=0).order_by("-follows", "-carts", "pk").first()
+    if reader is None:
+        raise CommandError("Run seed_data first")
+    recipe = Recipe.objects.filter(author__following__user=reader).first()
+    others = list(
+        Recipe.objects.exclude(favourite__user=reader).exclude(
+            shopping_cart__user=reader
+        ).values_list("pk", flat=True)[:11]
+    )
+    other_author = User.objects.exclude(following__user=reader).exclude(
+        pk=reader.pk
+    ).filter(recipes_count__gt=0).first()
+    ingredient = Ingredient.objects.filter(
+        recipe__shopping_cart__user=reader
+    ).first()
+    tag = Tag.objects.filter(recipe=recipe).first()
+    if None in (recipe, other_author, ingredient, tag) or len(others) < 11:
+        raise CommandError("Seeded dataset is too small")
+    return {
+        "token": Token.objects.get_or_create(user=reader)[0].key,
+        "email": reader.email,
+        "recipe": recipe.pk,
+        "other_recipe": others[0],
+        "bulk": others[1:],
+        "author": recipe.author_id,
+        "other_author": other_author.pk,
+        "ingredient": ingredient.pk,
+        "ingredients": list(
+            Ingredient.objects.values_list("pk", flat=True)[:5]
+        ),
+        "prefix": ingredient.name[:2],
+        "tag": tag.pk,
+        "tag_slug": tag.slug,
+        "new_users": 0,
+    }
+
+
+def request(
+    clients: Dict[bool, Client], route: Route, context: dict
+) -> Tuple[int, int, float, dict]:
+    """Send the route, return status, queries, milliseconds and body."""
+    name, method, url, body, expected, authenticated = route
+    kwargs: dict = {}
+    if body is not None:
+        kwargs = {
+            "data": json.dumps(body(context)),
+            "content_type": "application/json",
+        }
+    client: Client = clients[authenticated]
+    with CaptureQueriesContext(connection) as queries:
+        start: float = time.perf_counter()
+        response = getattr(client, method)(url.format(**context), **kwargs)
+        content: bytes = (
+            b"".join(response.streaming_content)
+            if response.streaming else response.content
+        )
+        elapsed: float = (time.perf_counter() - start) * 1000
+    if response.status_code != expected:
+        raise CommandError(
+            f"{name}: expected {expected}, got {response.status_code} "
+            f"{content[:200]!r}"
+        )
+    data: dict = {}
+    if response.get("Content-Type", "").startswith("application/json"):
+        data = json.loads(content or b"{}")
+    return response.status_code, len(queries.captured_queries), elapsed, data
+
+
+def run_routes(
+    clients: Dict[bool, Client], context: dict, record: Callable
+) -> None:
+    """Run every route once, passing measurements to record."""
+    for route in ROUTES:
+        _, queries, elapsed, data = request(clients, route, context)
+        if route[0] == "recipes-create":
+            context["created_recipe"] = data["id"]
+        record(route[0], queries, elapsed)
+
+
+def run(context: dict, iterations: int) -> Dict[str, dict]:
+    """Time the routes, then trace memory in separate untimed runs."""
+    clients: Dict[bool, Client] = {
+        False: Client(),
+        True: Client(HTTP_AUTHORIZATION=f"Token {context['token']}"),
+    }
+    queries: Dict[str, int] = {}
+    timings: Dict[str, List[float]] = {route[0]: [] for route in ROUTES}
+    peaks: Dict[str, List[int]] = {route[0]: [] for route in ROUTES}
+    traced: Dict[str, int] = {"current": 0}
+
+    def record_time(name: str, count: int, elapsed: float) -> None:
+        queries[name] = max(queries.get(name, 0), count)
+        timings[name].append(elapsed)
+
+    def record_memory(name: str, count: int, elapsed: float) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        peaks[name].append(peak - traced["current"])
+        traced["current"] = current
+        tracemalloc.reset_peak()
+
+    for _ in range(iterations):
+        run_routes(clients, context, record_time)
+    tracemalloc.start()
+    try:
+        for _ in range(min(iterations, MEMORY_ITERATIONS)):
+            run_routes(clients, context, record_memory)
+    finally:
+        tracemalloc.stop()
+    return {
+        name: {
+            "queries": queries[name],
+            "time_ms": round(statistics.median(timings[name]), 3),
+            "peak_kb": round(statistics.median(peaks[name]) / 1024, 1),
+        }
+        for name in timings
+    }
+
+
+def compare(
+    results: Dict[str, dict], baseline: Dict[str, dict],
+    time_tolerance: float, time_slack: float,
+    memory_tolerance: float, memory_slack: float,
+) -> List[str]:
+    """Return descriptions of routes that regressed against baseline."""
+    regressions: List[str] = []
+    for name, result in results.items():
+        expected: Optional[dict] = baseline.get(name)
+        if expected is None:
+            regressions.append(f"{name}: missing from baseline")
+            continue
+        if result["queries"] > expected["queries"]:
+            regressions.append(
+                f"{name}: {result['queries']} queries, "
+                f"baseline {expected['queries']}"
+            )
+        # Only query counts are compared when either side lacks a metric
+        if "time_ms" not in result or "time_ms" not in expected:
+            continue
+        if result["time_ms"] > (
+            expected["time_ms"] * (1 + time_tolerance) + time_slack
+        ):
+            regressions.append(
+                f"{name}: {result['time_ms']} ms, "
+                f"baseline {expected['time_ms']} ms"
+            )
+        if result["peak_kb"] > (
+            expected["peak_kb"] * (1 + memory_tolerance) + memory_slack
+        ):
+            regressions.append(
+                f"{name}: {result['peak_kb']} KiB, "
+                f"baseline {expected['peak_kb']} KiB"
+            )
+    return regressions
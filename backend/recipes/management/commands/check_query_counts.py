@@ -0,0 +1,172 @@
+from typing import Dict, List, Tuple
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (FavouriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, RecipeScore, ShoppingCart,
+                            ShoppingListItem, Tag, recount_authors)
+from users.models import Follow
+
+User = get_user_model()
+
+AUTHORS = 3
+TAGS = 3
+RECIPES_PER_AUTHOR = 4
+INGREDIENTS_PER_RECIPE = 3
+PAGE_LIMITS = (1, 6)
+
+# name: (authenticated, url, queries)
+QUERY_BUDGETS: Dict[str, Tuple[bool, str, int]] = {
+    "recipe-list-anonymous": (False, "/api/recipes/?limit={limit}", 5),
+    "recipe-list": (True, "/api/recipes/?limit={limit}", 6),
+    "recipe-list-cursor": (
+        True, "/api/recipes/?pagination=cursor&limit={limit}", 5
+    ),
+    "recipe-list-filtered": (
+        True,
+        "/api/recipes/?tags={tag}&is_favorited=1&is_in_shopping_cart=0"
+        "&limit={limit}",
+        7,
+    ),
+    "recipe-popular": (True, "/api/recipes/popular/?limit={limit}", 6),
+    "recipe-detail": (True, "/api/recipes/{recipe}/", 7),
+    "subscriptions": (
+        True,
+        "/api/users/subscriptions/?limit={limit}&recipes_limit={limit}",
+        5,
+    ),
+    "download-pdf": (True, "/api/recipes/download_shopping_cart/", 2),
+    "download-txt": (
+        True, "/api/recipes/download_shopping_cart/?format=txt", 2
+    ),
+    "download-csv": (
+        True, "/api/recipes/download_shopping_cart/?format=csv", 2
+    ),
+}
+
+
+class Command(BaseCommand):
+    """Custom command pinning the number of queries of API endpoints."""
+    help: str = (
+        "Seed a small dataset inside a rolled-back transaction, request "
+        "list, detail, subscriptions and download endpoints and fail if "
+        "any of them runs more queries than its budget or if the count "
+        "depends on the page size. Run it against a development database"
+    )
+
+    @override_settings(
+        ALLOWED_HOSTS=["testserver"],
+        CACHES={
+            alias: {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": f"check_query_counts_{alias}",
+            }
+            for alias in ("default", "responses")
+        },
+    )
+    def handle(self, *args, **options) -> None:
+        """Report query counts and raise if any budget is broken."""
+        with transaction.atomic():
+            reader, context = seed()
+            token: str = Token.objects.create(user=reader).key
+            failures: List[str] = []
+            for name, (authenticated, url, budget) in QUERY_BUDGETS.items():
+                client = Client()
+                if authenticated:
+                    client.defaults["HTTP_AUTHORIZATION"] = f"Token {token}"
+                counts: List[int] = []
+                for limit in PAGE_LIMITS:
+                    status, queries = count_queries(
+                        client, url.format(limit=limit, **context)
+                    )
+                    if status != 200:
+                        failures.append(f"{name}: status {status}")
+                    counts.append(queries)
+                self.stdout.write(
+                    f"{name}: {', '.join(map(str, counts))} "
+                    f"queries (budget {budget})"
+                )
+                if max(counts) > budget:
+                    failures.append(
+                        f"{name}: {max(counts)} queries, budget {budget}"
+                    )
+                if len(set(counts)) > 1:
+                    failures.append(
+                        f"{name}: query count depends on page size"
+                    )
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Query counts are within budget"))
+
+
+def seed() -> Tuple[User, Dict[str, object]]:
+    """Create authors with recipes and a reader who uses all features."""
+    users: List[User] = [
+        User.objects.create_user(
+            username=f"check_queries_{i}",
+            email=f"check_queries_{i}@example.com",
+            first_name="check",
+            last_name="queries",
+        )
+        for i in range(AUTHORS + 1)
+    ]
+    reader, authors = users[0], users[1:]
+    tags: List[Tag] = [
+        Tag.objects.create(
+            name=f"check-queries-{i}",
+            slug=f"check-queries-{i}",
+            color="#000000",
+        )
+        for i in range(TAGS)
+    ]
+    ingredients: List[Ingredient] = [
+        Ingredient.objects.create(
+            name=f"check queries {i}", measurement_unit="г"
+        )
+        for i in range(RECIPES_PER_AUTHOR * INGREDIENTS_PER_RECIPE)
+    ]
+    recipes: List[Recipe] = []
+    for author in authors:
+        for i in range(RECIPES_PER_AUTHOR):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f"check queries {i}",
+                text="check queries",
+                cooking_time=1,
+                image="recipes/check_queries.png",
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredients[i * INGREDIENTS_PER_RECIPE + j],
+                    amount=j + 1,
+                )
+                for j in range(INGREDIENTS_PER_RECIPE)
+            )
+            recipes.append(recipe)
+        Follow.objects.create(user=reader, author=author)
+    for recipe in recipes[::2]:
+        FavouriteRecipe.objects.create(user=reader, recipe=recipe)
+    for recipe in recipes[1::2]:
+        ShoppingCart.objects.create(user=reader, recipe=recipe)
+    ShoppingListItem.objects.refresh([reader])
+    Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]).recount()
+    recount_authors(User.objects.filter(pk__in=[user.pk for user in users]))
+    RecipeScore.objects.refresh()
+    return reader, {"tag": tags[0].slug, "recipe": recipes[0].pk}
+
+
+def count_queries(client: Client, url: str) -> Tuple[int, int]:
+    """Request url and return status code and number of queries run."""
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+        if response.streaming:
+            b"".join(response.streaming_content)
+    return response.status_code, len(context.captured_queries)
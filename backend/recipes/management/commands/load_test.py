@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from typing import Dict, List, Tuple
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+# name, url; the ASGI mode serves these routes with async views
+LOAD_ROUTES: List[Tuple[str, str]] = [
+    ("tags-list", "/api/tags/"),
+    ("ingredients-search", "/api/ingredients/?name={prefix}"),
+    ("recipes-list", "/api/recipes/"),
+    ("recipes-detail", "/api/recipes/{recipe}/"),
+]
+DOWNLOAD_ROUTE: Tuple[str, str] = (
+    "download-pdf", "/api/recipes/download_shopping_cart/"
+)
+INGREDIENT_PREFIX = "мо"
+TIMEOUT = 30
+# route: [(latency in seconds, succeeded)]
+Results = Dict[str, List[Tuple[float, bool]]]
+
+
+class Command(BaseCommand):
+    """Custom command comparing running servers under the same load."""
+    help: str = (
+        "Send concurrent requests to the hot read endpoints of every "
+        "target for a fixed time and report throughput and latency "
+        "percentiles. Start the WSGI and ASGI servers with the same "
+        "number of workers, e.g. --target wsgi=http://127.0.0.1:9000 "
+        "--target asgi=http://127.0.0.1:9001"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--target", action="append", required=True,
+            help="name=base url of a running server, may be repeated",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=16,
+            help="Number of concurrent clients",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10,
+            help="Seconds of load per target",
+        )
+        parser.add_argument(
+            "--token", help="Authenticate requests with this token",
+        )
+        parser.add_argument(
+            "--with-downloads", action="store_true",
+            help="Mix shopping list pdf downloads in, requires --token",
+        )
+
+    def handle(self, *args, **options) -> None:
+        """Load every target in turn and print a comparison."""
+        targets: List[Tuple[str, str]] = []
+        for target in options["target"]:
+            name, sep, url = target.partition("=")
+            if not sep or not url:
+                raise CommandError(f"Expected name=url, got {target!r}")
+            targets.append((name, url.rstrip("/")))
+        routes: List[Tuple[str, str]] = list(LOAD_ROUTES)
+        if options["with_downloads"]:
+            if not options["token"]:
+                raise CommandError("--with-downloads requires --token")
+            routes.append(DOWNLOAD_ROUTE)
+        headers: Dict[str, str] = {}
+        if options["token"]:
+            headers["Authorization"] = f"Token {options['token']}"
+        summary: List[Tuple[str, int, float, float, int]] = []
+        for name, url in targets:
+            context = {
+                "prefix": quote(INGREDIENT_PREFIX), "recipe": first_recipe(url)
+            }
+            results: Results = run_load(
+                url,
+                [(route, path.format(**context)) for route, path in routes],
+                headers,
+                options["concurrency"],
+                options["duration"],
+            )
+            self.stdout.write(f"{name} ({url})")
+            for route, samples in results.items():
+                self.stdout.write(f"  {route}: {describe(samples)}")
+            samples = [
+                sample for items in results.values() for sample in items
+            ]
+            latencies = sorted(latency for latency, _ in samples)
+            summary.append((
+                name,
+                len(samples),
+                len(samples) / options["duration"],
+                percentile(latencies, 0.95),
+                sum(not ok for _, ok in samples),
+            ))
+        self.stdout.write("Summary")
+        for name, count, rps, p95, errors in summary:
+            self.stdout.write(
+                f"  {name}: {count} requests, {rps:.1f} req/s, "
+                f"p95 {p95 * 1000:.1f}ms, {errors} errors"
+            )
+
+
+def first_recipe(url: str) -> int:
+    """Return the id of the newest recipe of the target."""
+    try:
+        with urlopen(f"{url}/api/recipes/?limit=1", timeout=TIMEOUT) as file:
+            results = json.load(file)["results"]
+    except (OSError, ValueError, KeyError) as error:
+        raise CommandError(f"{url} is not reachable: {error}")
+    if not results:
+        raise CommandError(f"{url} has no recipes, run seed_data first")
+    return results[0]["id"]
+
+
+def request(url: str, headers: Dict[str, str]) -> Tuple[float, bool]:
+    """Fetch url to the end and return latency and success."""
+    start = time.perf_counter()
+    try:
+        with urlopen(Request(url, headers=headers), timeout=TIMEOUT) as file:
+            file.read()
+            ok = file.status == 200
+    except (HTTPException, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_load(
+    url: str, routes: List[Tuple[str, str]], headers: Dict[str, str],
+    concurrency: int, duration: float,
+) -> Results:
+    """Have every client cycle through routes until the time is up."""
+    results: Results = defaultdict(list)
+    lock = threading.Lock()
+    deadline: float = time.perf_counter() + duration
+
+    def client(offset: int) -> None:
+        samples: Results = defaultdict(list)
+        index = offset
+        while time.perf_counter() < deadline:
+            route, path = routes[index % len(routes)]
+            samples[route].append(request(f"{url}{path}", headers))
+            index += 1
+        with lock:
+            for route, items in samples.items():
+                results[route].extend(items)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [
+            executor.submit(client, offset) for offset in range(concurrency)
+        ]:
+            future.result()
+    return {route: results[route] for route, _ in routes}
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted latencies."""
+    if not latencies:
+        return 0.0
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+
+def describe(samples: List[Tuple[float, bool]]) -> str:
+    """Format count, median and tail latencies and errors of a route."""
+    latencies: List[float] = sorted(latency for latency, _ in samples)
+    errors: int = sum(not ok for _, ok in samples)
+    parts: List[str] = [
+        f"p{int(fraction * 100)} "
+        f"{percentile(latencies, fraction) * 1000:.1f}ms"
+        for fraction in (0.5, 0.95, 0.99)
+    ]
+    return f"{len(samples)} requests, {', '.join(parts)}, {errors} errors"
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Custom command for rebuilding aggregated shopping lists."""
+    help: str = (
+        "Rebuild ShoppingListItem table from shopping carts "
+        "or verify that it matches them"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only compare the table with shopping carts",
+        )
+
+    def handle(self, *args, **options) -> None:
+        """Rebuild the table or report mismatched rows.
+
+        Raise exception if verification finds mismatches.
+        """
+        if not options["verify"]:
+            ShoppingListItem.objects.refresh(User.objects.all())
+            self.stdout.write(
+                self.style.SUCCESS("Successfully rebuilt shopping lists")
+            )
+            return
+        mismatches = verify_shopping_lists()
+        for user, ingredient, expected, stored in mismatches:
+            self.stdout.write(
+                f"user={user} ingredient={ingredient} "
+                f"expected={expected} stored={stored}"
+            )
+        if mismatches:
+            raise CommandError(
+                f"{len(mismatches)} shopping list rows are out of date"
+            )
+        self.stdout.write(self.style.SUCCESS("Shopping lists are up to date"))
+
+
+def verify_shopping_lists() -> list:
+    """Return (user, ingredient, expected, stored) for mismatched rows."""
+    expected: dict = {
+        (row["recipe__shopping_cart__user"], row["ingredient"]):
+            row["total_amount"]
+        for row in ShoppingListItem.objects.aggregate_carts(
+            User.objects.all()
+        ).iterator()
+    }
+    stored: dict = {
+        (user, ingredient): total_amount
+        for user, ingredient, total_amount
+        in ShoppingListItem.objects.values_list(
+            "user", "ingredient", "total_amount"
+        ).iterator()
+    }
+    mismatches: list = []
+    for key in sorted(expected.keys() | stored.keys()):
+        if expected.get(key) != stored.get(key):
+            mismatches.append((*key, expected.get(key), stored.get(key)))
+    return mismatches
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import (FavouriteRecipe, Recipe, ShoppingCart,
+                            count_subquery, recount_authors)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Custom command for repairing denormalized counters."""
+    help: str = (
+        "Recompute favorites_count, in_carts_count and recipes_count "
+        "or verify that they match the related tables"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report rows with stale counters",
+        )
+
+    def handle(self, *args, **options) -> None:
+        """Repair the counters or report stale ones.
+
+        Raise exception if verification finds mismatches.
+        """
+        if not options["verify"]:
+            recipes: int = Recipe.objects.recount()
+            users: int = recount_authors(User.objects.all())
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Successfully recounted {recipes} recipes "
+                    f"and {users} users"
+                )
+            )
+            return
+        mismatches = verify_counters()
+        for model, pk, field, expected, stored in mismatches:
+            self.stdout.write(
+                f"{model} id={pk} {field}: "
+                f"expected={expected} stored={stored}"
+            )
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} counters are out of date")
+        self.stdout.write(self.style.SUCCESS("Counters are up to date"))
+
+
+def verify_counters() -> list:
+    """Return (model, pk, field, expected, stored) for stale counters."""
+    checks = (
+        (Recipe, "favorites_count", count_subquery(FavouriteRecipe, "recipe")),
+        (Recipe, "in_carts_count", count_subquery(ShoppingCart, "recipe")),
+        (User, "recipes_count", count_subquery(Recipe, "author")),
+    )
+    mismatches: list = []
+    for model, field, expected in checks:
+        rows = model.objects.annotate(expected=expected).values_list(
+            "pk", "expected", field
+        ).order_by("pk")
+        for pk, expected_value, stored in rows.iterator():
+            if expected_value != stored:
+                mismatches.append(
+                    (model.__name__, pk, field, expected_value, stored)
+                )
+    return mismatches
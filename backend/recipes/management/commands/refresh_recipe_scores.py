@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import RecipeScore
+
+
+class Command(BaseCommand):
+    """Custom command for refreshing recipe popularity scores."""
+    help: str = (
+        "Recompute time-decayed popularity of recipes from favourites "
+        "and shopping carts"
+    )
+
+    def handle(self, *args, **options) -> None:
+        """Rebuild RecipeScore table and stdout the number of scores."""
+        scored: int = RecipeScore.objects.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(f"Successfully scored {scored} recipes")
+        )
@@ -0,0 +1,224 @@
+import random
+from itertools import accumulate
+from typing import List, Sequence
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import (FavouriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, RecipeScore, ShoppingCart,
+                            ShoppingListItem, Tag, recount_authors)
+from users.models import Follow
+
+User = get_user_model()
+
+SEED_PREFIX = "seed_"
+SEED_PASSWORD = "seed-password"
+BATCH_SIZE = 1000
+ZIPF_EXPONENT = 1.1
+SEED_IMAGE = "recipes/seed.png"
+
+
+class Command(BaseCommand):
+    """Custom command for generating a dataset for benchmarks."""
+    help: str = (
+        "Create users, tags, recipes, follows, favourites and shopping "
+        "carts. Authors, recipe popularity and followed authors follow a "
+        "Zipf distribution, so a few authors and recipes get most of the "
+        f"activity. All users get the password {SEED_PASSWORD!r}"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--users", type=int, default=1000, help="Number of users",
+        )
+        parser.add_argument(
+            "--recipes", type=int, default=5000, help="Number of recipes",
+        )
+        parser.add_argument(
+            "--tags", type=int, default=12, help="Number of tags",
+        )
+        parser.add_argument(
+            "--follows", type=int, default=10,
+            help="Mean number of followed authors per user",
+        )
+        parser.add_argument(
+            "--favorites", type=int, default=30,
+            help="Mean number of favourite recipes per user",
+        )
+        parser.add_argument(
+            "--carts", type=int, default=5,
+            help="Mean number of recipes in a shopping cart",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Random seed",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options) -> None:
+        """Generate the dataset and refresh every derived table."""
+        if User.objects.filter(username__startswith=SEED_PREFIX).exists():
+            raise CommandError("Seed data already exists")
+        ingredients: List[int] = list(
+            Ingredient.objects.values_list("pk", flat=True)
+        )
+        if not ingredients:
+            raise CommandError("Load ingredients first")
+        rng = random.Random(options["seed"])
+        users: List[int] = create_users(options["users"])
+        tags: List[int] = create_tags(options["tags"])
+        authors: List[int] = users[:max(len(users) // 5, 1)]
+        recipes: List[int] = create_recipes(
+            rng, options["recipes"], authors, tags, ingredients
+        )
+        link(rng, Follow, "user", "author", users, authors, options["follows"])
+        link(
+            rng, FavouriteRecipe, "user", "recipe",
+            users, recipes, options["favorites"],
+        )
+        link(
+            rng, ShoppingCart, "user", "recipe",
+            users, recipes, options["carts"],
+        )
+        ShoppingListItem.objects.refresh(User.objects.filter(pk__in=users))
+        Recipe.objects.filter(pk__in=recipes).recount()
+        recount_authors(User.objects.filter(pk__in=authors))
+        RecipeScore.objects.refresh()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully seeded {len(users)} users "
+                f"and {len(recipes)} recipes"
+            )
+        )
+
+
+def zipf_weights(size: int) -> List[float]:
+    """Cumulative weights of a Zipf distribution over size ranked items."""
+    return list(
+        accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(size))
+    )
+
+
+def sample(rng, population: Sequence, weights: List[float], k: int) -> set:
+    """Draw up to k distinct items with the cumulative weights."""
+    k = min(k, len(population))
+    return set(rng.choices(population, cum_weights=weights, k=k))
+
+
+def create_users(count: int) -> List[int]:
+    """Create users sharing one precomputed password hash."""
+    password: str = make_password(SEED_PASSWORD)
+    User.objects.bulk_create(
+        (
+            User(
+                username=f"{SEED_PREFIX}{i}",
+                email=f"{SEED_PREFIX}{i}@example.com",
+                first_name="Seed",
+                last_name=f"User {i}",
+                password=password,
+            )
+            for i in range(count)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    return list(
+        User.objects.filter(username__startswith=SEED_PREFIX).order_by(
+            "pk"
+        ).values_list("pk", flat=True)
+    )
+
+
+def create_tags(count: int) -> List[int]:
+    """Create missing seed tags and return ids of all of them."""
+    Tag.objects.bulk_create(
+        (
+            Tag(
+                name=f"{SEED_PREFIX}{i}",
+                slug=f"{SEED_PREFIX}{i}",
+                color=f"#{i * 40503 % 0xFFFFFF:06x}",
+            )
+            for i in range(count)
+        ),
+        ignore_conflicts=True,
+    )
+    return list(
+        Tag.objects.filter(slug__startswith=SEED_PREFIX).values_list(
+            "pk", flat=True
+        )
+    )
+
+
+def create_recipes(
+    rng, count: int, authors: List[int], tags: List[int],
+    ingredients: List[int],
+) -> List[int]:
+    """Create recipes of Zipf-ranked authors with tags and ingredients."""
+    author_weights: List[float] = zipf_weights(len(authors))
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author_id=rng.choices(
+                    authors, cum_weights=author_weights
+                )[0],
+                name=f"Рецепт {i}",
+                text="Описание рецепта " * rng.randint(1, 10),
+                cooking_time=rng.randint(5, 120),
+                image=SEED_IMAGE,
+            )
+            for i in range(count)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    recipes: List[int] = list(
+        Recipe.objects.filter(image=SEED_IMAGE).order_by("pk").values_list(
+            "pk", flat=True
+        )
+    )
+    RecipeTag = Recipe.tags.through
+    RecipeTag.objects.bulk_create(
+        (
+            RecipeTag(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, min(rng.randint(1, 3), len(tags)))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe_id=recipe,
+                ingredient_id=ingredient,
+                amount=rng.randint(1, 500),
+            )
+            for recipe in recipes
+            for ingredient in rng.sample(
+                ingredients, min(rng.randint(3, 12), len(ingredients))
+            )
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    return recipes
+
+
+def link(
+    rng, model, source: str, target: str, sources: List[int],
+    targets: List[int], mean: int,
+) -> None:
+    """Link sources to Zipf-ranked targets, mean links per source."""
+    if mean <= 0:
+        return
+    weights: List[float] = zipf_weights(len(targets))
+    model.objects.bulk_create(
+        (
+            model(**{f"{source}_id": item, f"{target}_id": other})
+            for item in sources
+            for other in sample(
+                rng, targets, weights, int(rng.expovariate(1 / mean))
+            )
+            if other != item
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
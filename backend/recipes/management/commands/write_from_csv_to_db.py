@@ -1,37 +1,169 @@
 import csv
+import io
+import json
 import os
+from itertools import islice
+from typing import Iterator, List, Tuple
 
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from django.db.utils import IntegrityError
 
-from recipes.models import Ingredient
+from recipes.models import Ingredient, TableVersion
+from recipes.search import ingredient_index
 
 User = get_user_model()
 
+CHUNK_SIZE = 1000
+
 
 class Command(BaseCommand):
     """Custom command for reading csv file and saving data to database."""
     help: str = (
-        'Read csv files in "static/data" folder and write them to database',
+        'Read csv or json files in "data" folder and write them to database'
     )
 
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--file",
+            default="ingredients.csv",
+            help="File in data folder or path to a .csv or .json file",
+        )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Insert rows in chunks with bulk_create",
+        )
+        parser.add_argument(
+            "--copy",
+            action="store_true",
+            help="Bulk mode using COPY into a staging table (PostgreSQL)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Rows per bulk insert",
+        )
+
     def handle(self, *args, **options) -> None:
-        """Try to csv_to_db and stdout success text.
+        """Try to write ingredients to db and stdout success text.
 
         Raise exception if false.
         """
+        filename: str = options["file"]
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("--copy is supported only on PostgreSQL")
         try:
-            csv_to_db(Ingredient, "ingredients.csv")
-        except IntegrityError as error:
+            if options["copy"]:
+                total, inserted = copy_to_db(
+                    read_rows(filename), options["chunk_size"]
+                )
+            elif options["bulk"]:
+                total, inserted = bulk_to_db(
+                    Ingredient, read_rows(filename), options["chunk_size"]
+                )
+            else:
+                total, inserted = csv_to_db(Ingredient, filename)
+        except (IntegrityError, OSError, ValueError) as error:
             raise CommandError(error)
+        # bulk_create and COPY send no signals, so bump the version that
+        # ETags and the ingredient index are checked against by hand.
+        if inserted:
+            TableVersion.objects.bump("ingredients")
+        ingredient_index.invalidate()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully write to db: inserted {inserted}, "
+                f"skipped {total - inserted}"
+            )
+        )
 
-        self.stdout.write(self.style.SUCCESS("Successfully write to db"))
 
+def get_file_path(filename: str) -> str:
+    """Return path of the file, looking in data folder for bare names."""
+    if os.path.dirname(filename):
+        return os.path.abspath(filename)
+    return os.path.abspath(f"data/{filename}")
 
-def csv_to_db(model: Ingredient, filename: str) -> None:
-    """Read a csv file and create a new entry in database."""
-    file_path: str = os.path.abspath(f"data/{filename}")
+
+def read_rows(filename: str) -> Iterator[Tuple[str, str]]:
+    """Yield (name, measurement_unit) rows from a csv or json file."""
+    file_path: str = get_file_path(filename)
     with open(file_path, "r", encoding="utf-8") as f:
-        for line in csv.reader(f):
-            model.objects.get_or_create(name=line[0], measurement_unit=line[1])
+        if file_path.endswith(".json"):
+            for item in json.load(f):
+                yield item["name"], item["measurement_unit"]
+        else:
+            for line in csv.reader(f):
+                yield line[0], line[1]
+
+
+def chunked(rows: Iterator, size: int) -> Iterator[List]:
+    """Split rows into lists of at most size items."""
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_to_db(model: Ingredient, filename: str) -> Tuple[int, int]:
+    """Read a file and create a new entry in database for every line."""
+    total: int = 0
+    inserted: int = 0
+    for name, measurement_unit in read_rows(filename):
+        _, created = model.objects.get_or_create(
+            name=name, measurement_unit=measurement_unit
+        )
+        total += 1
+        inserted += created
+    return total, inserted
+
+
+def bulk_to_db(
+    model: Ingredient, rows: Iterator, chunk_size: int
+) -> Tuple[int, int]:
+    """Insert rows in chunks, skipping ones violating name_meas_unit."""
+    total: int = 0
+    with transaction.atomic():
+        count_before: int = model.objects.count()
+        for chunk in chunked(rows, chunk_size):
+            model.objects.bulk_create(
+                (
+                    model(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in chunk
+                ),
+                ignore_conflicts=True,
+            )
+            total += len(chunk)
+        inserted: int = model.objects.count() - count_before
+    return total, inserted
+
+
+def copy_to_db(rows: Iterator, chunk_size: int) -> Tuple[int, int]:
+    """COPY rows into a staging table and merge them into ingredients."""
+    table: str = Ingredient._meta.db_table
+    total: int = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE ingredient_import "
+            "(name text, measurement_unit text) ON COMMIT DROP"
+        )
+        for chunk in chunked(rows, chunk_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            buffer.seek(0)
+            cursor.copy_expert(
+                "COPY ingredient_import FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            total += len(chunk)
+        cursor.execute(
+            f"INSERT INTO {table} (name, measurement_unit) "
+            "SELECT DISTINCT name, measurement_unit FROM ingredient_import "
+            "ON CONFLICT ON CONSTRAINT name_meas_unit DO NOTHING"
+        )
+        inserted: int = cursor.rowcount
+    return total, inserted
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.3 on 2026-10-18 07:10
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations
+from django.db.migrations.recorder import MigrationRecorder
+
+
+def backdate_existing_carts(apps, schema_editor):
+    """Move carts older than date_added out of the popularity window.
+
+    0008 filled date_added of existing carts with its own run time, so
+    they would all count as fresh adds. Rows dated before 0008 was
+    recorded as applied are exactly those.
+    """
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    applied = MigrationRecorder(
+        schema_editor.connection
+    ).migration_qs.filter(
+        app='recipes', name='0008_recipe_score'
+    ).values_list('applied', flat=True).first()
+    if applied is None:
+        return
+    ShoppingCart.objects.filter(date_added__lte=applied).update(
+        date_added=applied - timedelta(
+            days=settings.POPULARITY_WINDOW_DAYS + 1
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_fill_shopping_lists'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backdate_existing_carts, migrations.RunPython.noop
+        ),
+    ]
@@ -1,7 +1,16 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (Count, Exists, F, OuterRef, Subquery, Sum, Value,
+                              Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -11,6 +20,8 @@ MAX_VALUE_INGREDIENT = 500
 NAME_MAX_CHARACTERS = 150
 TEXT_MAX_CHARACTERS = 400
 IMAGE_MAX_CHARACTERS = 7
+FAVORITE_SCORE_WEIGHT = 1.0
+CART_SCORE_WEIGHT = 0.5
 
 
 class Tag(models.Model):
@@ -50,6 +61,78 @@ class Tag(models.Model):
         return self.name
 
 
+def change_counter(queryset, field, delta):
+    """Shift a denormalized counter of the rows in a single UPDATE."""
+    if not delta:
+        return 0
+    return queryset.update(**{field: F(field) + delta})
+
+
+def count_subquery(model, field):
+    """Return correlated COUNT of model rows whose field is the outer pk."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total"),
+            output_field=models.PositiveIntegerField(),
+        ),
+        0,
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        """Annotate is_favorited and is_in_shopping_cart for the user."""
+        if not user or user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                FavouriteRecipe.objects.filter(
+                    user=user, recipe=OuterRef("pk")
+                )
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
+
+    def latest_by_author(self, authors, limit):
+        """Keep the limit newest recipes of each of the authors.
+
+        Recipes of the authors are ranked once with ROW_NUMBER. Django 3.2
+        cannot filter on a window, so the ranking is wrapped in raw SQL.
+        """
+        ranked = self.model.objects.filter(author__in=authors).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F("author")],
+                order_by=[F("pub_date").desc(), F("id").desc()],
+            )
+        ).values("pk", "position").order_by()
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(
+            pk__in=RawSQL(
+                f'SELECT "id" FROM ({sql}) ranked WHERE "position" <= %s',
+                (*params, limit),
+            )
+        )
+
+    def recount(self):
+        """Recompute favorites_count and in_carts_count of the recipes."""
+        return self.update(
+            favorites_count=count_subquery(FavouriteRecipe, "recipe"),
+            in_carts_count=count_subquery(ShoppingCart, "recipe"),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -90,15 +173,54 @@ class Recipe(models.Model):
         verbose_name="Дата публикации",
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном",
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name="В списках покупок",
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    COUNTER_FIELDS = ("favorites_count", "in_carts_count")
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-id")
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="recipe_pub_date_id_idx",
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_author_pub_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Never write counters back from a possibly stale instance."""
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+def recount_authors(authors):
+    """Recompute recipes_count of the users in the queryset."""
+    return authors.update(recipes_count=count_subquery(Recipe, "author"))
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -154,6 +276,53 @@ class RecipeIngredient(models.Model):
         ]
 
 
+class UserRecipeManager(models.Manager):
+    """Batched links of a user to recipes keeping Recipe counters exact."""
+
+    @transaction.atomic
+    def add(self, user, recipes):
+        """Link existing recipes to the user, skipping linked ones.
+
+        Returns ids of the newly linked recipes.
+        """
+        recipes = set(recipes)
+        added = recipes - set(
+            self.filter(user=user, recipe__in=recipes).values_list(
+                "recipe", flat=True
+            )
+        )
+        self.bulk_create(
+            (self.model(user=user, recipe_id=recipe) for recipe in added),
+            ignore_conflicts=True,
+        )
+        Recipe.objects.filter(pk__in=added).recount()
+        return added
+
+    @transaction.atomic
+    def remove(self, user, recipes):
+        """Unlink the recipes from the user in a single DELETE."""
+        recipes = set(recipes)
+        deleted, _ = self.filter(user=user, recipe__in=recipes).delete()
+        if deleted:
+            Recipe.objects.filter(pk__in=recipes).recount()
+        return deleted
+
+    @transaction.atomic
+    def replace(self, user, recipes):
+        """Make the recipes the only ones linked to the user.
+
+        Returns ids of the added and of the removed recipes.
+        """
+        recipes = set(recipes)
+        stale = set(
+            self.filter(user=user).exclude(recipe__in=recipes).values_list(
+                "recipe", flat=True
+            )
+        )
+        self.remove(user, stale)
+        return self.add(user, recipes), stale
+
+
 class FavouriteRecipe(models.Model):
     user = models.ForeignKey(
         User,
@@ -167,11 +336,14 @@ class FavouriteRecipe(models.Model):
         verbose_name="Рецепт",
         related_name="favourite",
     )
+    counter_field = "favorites_count"
     date_added: models.DateTimeField = models.DateTimeField(
         verbose_name="дата создания",
         auto_now_add=True
     )
 
+    objects = UserRecipeManager()
+
     class Meta:
         verbose_name = "Избранное"
         verbose_name_plural = "Избранное"
@@ -203,6 +375,13 @@ class ShoppingCart(models.Model):
         related_name="shopping_cart",
         verbose_name="Рецепт",
     )
+    counter_field = "in_carts_count"
+    date_added: models.DateTimeField = models.DateTimeField(
+        verbose_name="дата создания",
+        auto_now_add=True
+    )
+
+    objects = UserRecipeManager()
 
     class Meta:
         verbose_name = "Список покупок"
@@ -219,3 +398,216 @@ class ShoppingCart(models.Model):
             f"{self.user.username} добавил "
             f"{self.recipe.name} "
         )
+
+
+class ShoppingListItemManager(models.Manager):
+    def aggregate_carts(self, users, ingredients=None):
+        """Sum ingredient amounts over the users' shopping carts."""
+        rows = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user__in=users
+        )
+        if ingredients is not None:
+            rows = rows.filter(ingredient__in=ingredients)
+        return rows.values(
+            "recipe__shopping_cart__user", "ingredient"
+        ).annotate(total_amount=Sum("amount")).order_by()
+
+    @transaction.atomic
+    def refresh(self, users, ingredients=None):
+        """Recompute aggregated items of the users.
+
+        Only rows of the given ingredients are rebuilt, so adding or
+        removing a recipe touches just the ingredients of that recipe.
+        The user rows are locked first, so concurrent refreshes of one
+        user run one after another instead of inserting the same item.
+        """
+        if not isinstance(users, models.QuerySet):
+            users = [getattr(user, "pk", user) for user in users]
+        list(
+            User.objects.select_for_update().filter(
+                pk__in=users
+            ).order_by("pk").values_list("pk", flat=True)
+        )
+        items = self.filter(user__in=users)
+        if ingredients is not None:
+            items = items.filter(ingredient__in=ingredients)
+        items.delete()
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=row["recipe__shopping_cart__user"],
+                    ingredient_id=row["ingredient"],
+                    total_amount=row["total_amount"],
+                )
+                for row in self.aggregate_carts(users, ingredients)
+            ),
+            batch_size=1000,
+        )
+
+    def refresh_recipes(self, users, recipes):
+        """Recompute the users' items for ingredients of the recipes."""
+        self.refresh(
+            users,
+            RecipeIngredient.objects.filter(recipe__in=recipes).values(
+                "ingredient"
+            ),
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Ингридиент",
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name="Количество",
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = "Продукт списка покупок"
+        verbose_name_plural = "Продукты списка покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="user_ingredient_shop_list"
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.user.username}: {self.ingredient.name} "
+            f"{self.total_amount} {self.ingredient.measurement_unit}"
+        )
+
+
+class TableVersionManager(models.Manager):
+    def bump(self, *names):
+        """Increment versions of the tables, creating missing rows."""
+        now = timezone.now()
+        for name in names:
+            if self.filter(name=name).update(
+                version=F("version") + 1, updated=now
+            ):
+                continue
+            _, created = self.get_or_create(
+                name=name, defaults={"version": 1, "updated": now}
+            )
+            if not created:
+                self.filter(name=name).update(
+                    version=F("version") + 1, updated=now
+                )
+
+    def get_state(self, names):
+        """Return versions of the tables and their last change time."""
+        versions = dict.fromkeys(names, 0)
+        last_modified = None
+        for name, version, updated in self.filter(
+            name__in=names
+        ).values_list("name", "version", "updated"):
+            versions[name] = version
+            if last_modified is None or updated > last_modified:
+                last_modified = updated
+        return versions, last_modified
+
+
+class TableVersion(models.Model):
+    name = models.CharField(
+        verbose_name="Таблица",
+        max_length=NAME_MAX_CHARACTERS,
+        primary_key=True,
+    )
+    version = models.PositiveBigIntegerField(
+        verbose_name="Версия",
+        default=0,
+    )
+    updated = models.DateTimeField(
+        verbose_name="Дата изменения",
+        default=timezone.now,
+    )
+
+    objects = TableVersionManager()
+
+    class Meta:
+        verbose_name = "Версия таблицы"
+        verbose_name_plural = "Версии таблиц"
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+class RecipeScoreManager(models.Manager):
+    @transaction.atomic
+    def refresh(self, now=None):
+        """Recompute time-decayed popularity of all recipes.
+
+        Every favourite and cart add within POPULARITY_WINDOW_DAYS adds
+        its weight halved for each POPULARITY_HALF_LIFE_DAYS of age.
+        Returns the number of scored recipes.
+        """
+        now = now or timezone.now()
+        since = now - timedelta(days=settings.POPULARITY_WINDOW_DAYS)
+        half_life = timedelta(
+            days=settings.POPULARITY_HALF_LIFE_DAYS
+        ).total_seconds()
+        scores = defaultdict(float)
+        for model, weight in (
+            (FavouriteRecipe, FAVORITE_SCORE_WEIGHT),
+            (ShoppingCart, CART_SCORE_WEIGHT),
+        ):
+            events = model.objects.filter(date_added__gte=since).values_list(
+                "recipe", "date_added"
+            ).order_by()
+            for recipe, date_added in events.iterator():
+                age = max((now - date_added).total_seconds(), 0)
+                scores[recipe] += weight * 0.5 ** (age / half_life)
+        self.all().delete()
+        self.bulk_create(
+            (
+                self.model(recipe_id=recipe, score=score, updated=now)
+                for recipe, score in scores.items()
+            ),
+            batch_size=1000,
+        )
+        return len(scores)
+
+
+class RecipeScore(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="score",
+        verbose_name="Рецепт",
+    )
+    score = models.FloatField(
+        verbose_name="Популярность",
+    )
+    updated = models.DateTimeField(
+        verbose_name="Дата расчета",
+        default=timezone.now,
+    )
+
+    objects = RecipeScoreManager()
+
+    class Meta:
+        verbose_name = "Популярность рецепта"
+        verbose_name_plural = "Популярность рецептов"
+        indexes = [
+            models.Index(
+                fields=["-score", "-recipe"],
+                name="recipe_score_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.score:.3f}"
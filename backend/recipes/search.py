@@ -0,0 +1,78 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Ingredient, TableVersion
+
+INDEX_TABLE = "ingredients"
+
+
+class IngredientIndex:
+    """In-memory autocomplete index of ingredient names.
+
+    Names are kept lowercased in a sorted list, so prefix matches are
+    found with a binary search. The index is loaded lazily in every
+    worker and rebuilt when the ingredients TableVersion changes. The
+    version is read from the database at most once per
+    INGREDIENT_INDEX_TTL seconds, so changes made by other processes,
+    imports included, show up within that time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._version = None
+        self._checked = None
+
+    def invalidate(self):
+        """Drop the local index, other processes follow the version."""
+        with self._lock:
+            self._keys = self._items = None
+
+    def load(self):
+        """Return sorted keys and items, rebuilding them if outdated."""
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._keys is not None
+                and now - self._checked < settings.INGREDIENT_INDEX_TTL
+            ):
+                return self._keys, self._items
+            version = TableVersion.objects.filter(
+                name=INDEX_TABLE
+            ).values_list("version", flat=True).first()
+            self._checked = now
+            if self._keys is None or self._version != version:
+                items = sorted(
+                    Ingredient.objects.values(
+                        "id", "name", "measurement_unit"
+                    ),
+                    key=lambda item: (item["name"].lower(), item["id"]),
+                )
+                self._keys = [item["name"].lower() for item in items]
+                self._items = items
+                self._version = version
+            return self._keys, self._items
+
+    def search(self, value, limit):
+        """Return up to limit ingredients, prefix matches first."""
+        keys, items = self.load()
+        value = value.lower()
+        start = bisect.bisect_left(keys, value)
+        found = []
+        for index in range(start, len(keys)):
+            if len(found) >= limit or not keys[index].startswith(value):
+                break
+            found.append(items[index])
+        for index, key in enumerate(keys):
+            if len(found) >= limit:
+                break
+            if value in key and not key.startswith(value):
+                found.append(items[index])
+        return found
+
+
+ingredient_index = IngredientIndex()
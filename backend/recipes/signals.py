@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Ingredient, Recipe, TableVersion, Tag
+from .search import ingredient_index
+
+User = get_user_model()
+
+# RecipeIngredient has no receiver: it would disable fast deletes and
+# bump once per row. Its rows are only written together with the recipe,
+# whose save bumps "recipes" once.
+TABLE_VERSIONS = {
+    Tag: "tags",
+    Ingredient: "ingredients",
+    Recipe: "recipes",
+    User: "users",
+}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+def bump_table_version(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    TableVersion.objects.bump(TABLE_VERSIONS[sender])
+
+
+for model in TABLE_VERSIONS:
+    post_save.connect(bump_table_version, sender=model)
+    post_delete.connect(bump_table_version, sender=model)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, action, **kwargs):
+    if action.startswith("post_"):
+        TableVersion.objects.bump("recipes")
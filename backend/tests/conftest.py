@@ -0,0 +1,46 @@
+import pytest
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.management.commands.check_query_counts import seed
+from recipes.search import ingredient_index
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(settings, tmp_path):
+    """Keep uploaded images and cached data of a test to itself."""
+    settings.MEDIA_ROOT = tmp_path
+    for cache in caches.all():
+        cache.clear()
+    ingredient_index.invalidate()
+
+
+@pytest.fixture
+def dataset(db):
+    """Authors with tagged recipes and a reader using every feature."""
+    return seed()
+
+
+@pytest.fixture
+def reader(dataset):
+    return dataset[0]
+
+
+@pytest.fixture
+def context(dataset):
+    return dataset[1]
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def reader_client(reader):
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=reader).key}"
+    )
+    return client
@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+from django.test import AsyncClient
+
+from api.metrics import REQUEST_QUERIES
+
+
+def observed_queries(view):
+    for metric in REQUEST_QUERIES.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_sum") and sample.labels["view"] == view:
+                return sample.value
+    return 0
+
+
+@pytest.fixture
+def asgi_settings(settings, transactional_db):
+    """Serve the async urlconf; pool threads need committed data."""
+    settings.ROOT_URLCONF = "foodgram.asgi_urls"
+    settings.METRICS_ENABLED = True
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_SAMPLE_RATE = 1
+    return settings
+
+
+def test_pooled_views_report_their_queries(asgi_settings):
+    before = observed_queries("TagsViewSet.list")
+    response = asyncio.run(AsyncClient().get("/api/tags/"))
+    assert response.status_code == 200
+    assert observed_queries("TagsViewSet.list") > before
+    assert '"0 queries"' not in response["Server-Timing"]
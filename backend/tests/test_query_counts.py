@@ -0,0 +1,82 @@
+import pytest
+
+from recipes.management.commands.benchmark_api import IMAGE
+from recipes.management.commands.check_query_counts import (PAGE_LIMITS,
+                                                            QUERY_BUDGETS)
+from recipes.models import Ingredient, Tag
+
+CREATE_QUERIES = 22
+UPDATE_QUERIES = 23
+MAX_INGREDIENTS = 10
+
+
+@pytest.fixture
+def ingredients(dataset):
+    """Enough ingredients to replace every one of a recipe."""
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f"pytest {i}", measurement_unit="г")
+        for i in range(2 * MAX_INGREDIENTS)
+    )
+
+
+def recipe_body(ingredients, offset=0):
+    return {
+        "ingredients": [
+            {"id": pk, "amount": 10}
+            for pk in Ingredient.objects.order_by("pk").values_list(
+                "pk", flat=True
+            )[offset:offset + ingredients]
+        ],
+        "tags": [Tag.objects.first().pk],
+        "image": IMAGE,
+        "name": "Рецепт",
+        "text": "Описание",
+        "cooking_time": 10,
+    }
+
+
+@pytest.mark.parametrize("limit", PAGE_LIMITS)
+@pytest.mark.parametrize("name", QUERY_BUDGETS)
+def test_read_endpoints_stay_within_budget(
+    name, limit, context, api_client, reader_client,
+    django_assert_max_num_queries,
+):
+    authenticated, url, budget = QUERY_BUDGETS[name]
+    client = reader_client if authenticated else api_client
+    with django_assert_max_num_queries(budget):
+        response = client.get(url.format(limit=limit, **context))
+        if response.streaming:
+            b"".join(response.streaming_content)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("count", (2, MAX_INGREDIENTS))
+def test_recipe_create_queries_do_not_depend_on_ingredients(
+    count, reader_client, ingredients, django_assert_num_queries
+):
+    with django_assert_num_queries(CREATE_QUERIES):
+        response = reader_client.post(
+            "/api/recipes/", recipe_body(count), format="json"
+        )
+    assert response.status_code == 201
+    assert len(response.data["ingredients"]) == count
+
+
+@pytest.mark.parametrize("count", (2, MAX_INGREDIENTS))
+def test_recipe_update_queries_do_not_depend_on_ingredients(
+    count, reader_client, ingredients, django_assert_num_queries
+):
+    recipe = reader_client.post(
+        "/api/recipes/", recipe_body(count), format="json"
+    ).data["id"]
+    with django_assert_num_queries(UPDATE_QUERIES):
+        response = reader_client.patch(
+            f"/api/recipes/{recipe}/",
+            recipe_body(count, offset=count),
+            format="json",
+        )
+    assert response.status_code == 200
+    assert {item["id"] for item in response.data["ingredients"]}.isdisjoint(
+        item["id"] for item in recipe_body(count)["ingredients"]
+    )
+    assert len(response.data["ingredients"]) == count
@@ -0,0 +1,152 @@
+import pytest
+from django.contrib import admin
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, ShoppingCart, Tag
+from users.models import CustomUser
+
+
+def recipe_ids(response):
+    return {recipe["id"] for recipe in response.data["results"]}
+
+
+def test_favorite_keeps_counter_exact(reader_client, dataset):
+    recipe = Recipe.objects.filter(favorites_count=0).first()
+    url = f"/api/recipes/{recipe.pk}/favorite/"
+    assert reader_client.post(url).status_code == 201
+    assert reader_client.post(url).status_code == 400
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 1
+    assert reader_client.delete(url).status_code == 204
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 0
+    call_command("recount_counters", "--verify")
+
+
+def test_cart_changes_keep_shopping_list_exact(reader_client, dataset):
+    recipes = list(
+        Recipe.objects.filter(in_carts_count=0).values_list("pk", flat=True)
+    )
+    assert reader_client.post(
+        f"/api/recipes/{recipes[0]}/shopping_cart/"
+    ).status_code == 201
+    response = reader_client.post(
+        "/api/recipes/shopping_cart/bulk/",
+        {"action": "replace", "recipes": recipes[1:]},
+        format="json",
+    )
+    assert response.status_code == 200
+    call_command("rebuild_shopping_lists", "--verify")
+    call_command("recount_counters", "--verify")
+
+
+def delete_with_api(author):
+    author.set_password("password")
+    author.save()
+    client = APIClient()
+    client.force_authenticate(author)
+    response = client.delete(
+        f"/api/users/{author.pk}/", {"current_password": "password"}
+    )
+    assert response.status_code == 204
+
+
+def delete_in_admin(author):
+    admin.site._registry[CustomUser].delete_model(None, author)
+
+
+@pytest.mark.parametrize("delete", (delete_with_api, delete_in_admin))
+def test_author_delete_refreshes_other_shopping_lists(
+    delete, reader, dataset
+):
+    author = ShoppingCart.objects.filter(user=reader).first().recipe.author
+    delete(author)
+    call_command("rebuild_shopping_lists", "--verify")
+    call_command("recount_counters", "--verify")
+
+
+def test_tags_filter_any_and_all(api_client, dataset):
+    first, second = (
+        Tag.objects.create(name=slug, slug=slug, color="#FFFFFF")
+        for slug in ("first", "second")
+    )
+    author = Recipe.objects.first().author
+    one, both = (
+        Recipe.objects.create(
+            author=author, name=name, text="t", cooking_time=1, image="x.png"
+        )
+        for name in ("one", "both")
+    )
+    one.tags.set([first])
+    both.tags.set([first, second])
+    url = "/api/recipes/?tags=first&tags=second"
+    assert recipe_ids(api_client.get(url)) == {one.pk, both.pk}
+    assert recipe_ids(api_client.get(f"{url}&tags_mode=all")) == {both.pk}
+
+
+def test_subscriptions_return_newest_recipes_of_each_author(
+    reader_client, dataset
+):
+    response = reader_client.get("/api/users/subscriptions/?recipes_limit=2")
+    assert response.status_code == 200
+    for author in response.data["results"]:
+        newest = list(
+            Recipe.objects.filter(author=author["id"]).values_list(
+                "pk", flat=True
+            )[:2]
+        )
+        assert [recipe["id"] for recipe in author["recipes"]] == newest
+
+
+def test_etag_changes_with_the_table(api_client, dataset):
+    etag = api_client.get("/api/tags/")["ETag"]
+    response = api_client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    Tag.objects.create(name="new", slug="new", color="#000000")
+    response = api_client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+def test_ingredient_import_changes_etag(api_client, db, tmp_path):
+    file = tmp_path / "ingredients.csv"
+    file.write_text("новый ингредиент,г\n", encoding="utf-8")
+    etag = api_client.get("/api/ingredients/")["ETag"]
+    call_command("write_from_csv_to_db", "--bulk", "--file", str(file))
+    response = api_client.get("/api/ingredients/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    response = api_client.get("/api/ingredients/?name=новый")
+    assert [item["name"] for item in response.data] == ["новый ингредиент"]
+
+
+def test_malformed_recipe_id_is_not_found(reader_client, dataset):
+    assert reader_client.get("/api/recipes/abc/").status_code == 404
+
+
+@pytest.mark.parametrize("method", ("post", "delete"))
+@pytest.mark.parametrize("relation", ("favorite", "shopping_cart"))
+def test_malformed_recipe_id_is_rejected(
+    method, relation, reader_client, dataset
+):
+    response = getattr(reader_client, method)(f"/api/recipes/abc/{relation}/")
+    assert response.status_code == 400
+    assert response.data == {"errors": "Такого рецепта нет"}
+
+
+@pytest.mark.parametrize("format", ("", "txt", "csv", "json"))
+def test_download_errors_are_json(format, api_client, django_user_model):
+    url = f"/api/recipes/download_shopping_cart/?format={format}"
+    assert api_client.get(url)["Content-Type"] == "application/json"
+    api_client.force_authenticate(
+        django_user_model.objects.create_user(
+            username="empty", email="empty@example.com", password="password"
+        )
+    )
+    response = api_client.get(url)
+    assert response.status_code == 400
+    assert response["Content-Type"] == "application/json"
+    response = api_client.get(
+        "/api/recipes/download_shopping_cart/?format=xml"
+    )
+    assert response.status_code == 404
+    assert response["Content-Type"] == "application/json"
@@ -1,15 +1,47 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.models import (Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
 
 from .models import CustomUser, Follow
 
 
 @admin.register(CustomUser)
 class UserAdmin(UserAdmin):
-    list_display = ("username", "first_name", "last_name", "email")
+    list_display = (
+        "username", "first_name", "last_name", "email", "recipes_count"
+    )
     search_fields = ("username",)
     list_filter = ("username", "email")
 
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, CustomUser.objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        recipes = list(
+            Recipe.objects.filter(
+                Q(favourite__user__in=queryset)
+                | Q(shopping_cart__user__in=queryset)
+            ).values_list("pk", flat=True).distinct()
+        )
+        carts = ShoppingCart.objects.filter(
+            recipe__author__in=queryset
+        ).exclude(user__in=queryset)
+        users = list(carts.values_list("user", flat=True).distinct())
+        ingredients = list(
+            RecipeIngredient.objects.filter(
+                recipe__shopping_cart__in=carts
+            ).values_list("ingredient", flat=True).distinct()
+        )
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipes).recount()
+        if users:
+            ShoppingListItem.objects.refresh(users, ingredients)
+
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):